@@ -15,16 +15,22 @@ from tkinter import ttk, messagebox, scrolledtext
 import threading
 import time
 import numpy as np
+from collections import deque
 from datetime import datetime
 
 from core.ranging_engine import RangingEngine
 from core.signal_processor import SignalProcessor
 from core.audio_io import AudioIO
+from core.log import setup_logging, clock_str
 
 
 class AnchorDeviceApp:
     """锚节点应用程序"""
     
+    MAX_HISTORY = 5000        # 内存中保留的测量记录数
+    MAX_TREE_ROWS = 500       # 历史列表最多显示的行数
+    FLUSH_INTERVAL_MS = 100   # 界面批量刷新间隔（毫秒）
+    
     def __init__(self, root):
         """
         初始化应用程序
@@ -46,12 +52,26 @@ class AnchorDeviceApp:
         self.engine.on_connection_changed = self.on_connection_changed
         self.engine.on_error = self.on_error
         
-        # 测量历史
-        self.measurements = []
+        # 测量历史（有界，长时间运行不会无限增长）
+        self.measurements = deque(maxlen=self.MAX_HISTORY)
+        self.measurement_count = 0
+        
+        # 待刷新到界面的测距结果，由测距线程写入、UI线程批量读取
+        self._pending = deque()
+        self._flush_scheduled = False
+        
+        # 本机IP缓存，由 update_ip 填充
+        self._local_ip = None
         
         # 创建UI
         self._create_ui()
         
+        # 预先打开常开的音频流，第一次测量不再等待PortAudio打开设备
+        try:
+            self.engine.audio.open_stream()
+        except Exception as e:
+            self.log(f"音频流启动失败: {e}")
+            
         # 绑定关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
@@ -183,19 +203,23 @@ class AnchorDeviceApp:
     def log(self, message):
         """添加日志"""
         self.log_text.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.log_text.insert(tk.END, f"[{clock_str(with_ms=False)}] {message}\n")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
         
     def update_ip(self):
         """更新本机IP显示"""
         ip = self.engine.get_local_ip()
+        self._local_ip = ip
         self.ip_label.config(text=ip)
         
     def copy_ip(self):
         """复制IP到剪贴板"""
-        ip = self.ip_label.cget("text")
+        ip = self._local_ip
+        if not ip:
+            # IP尚未获取，立即查询一次
+            self.update_ip()
+            ip = self._local_ip
         self.root.clipboard_clear()
         self.root.clipboard_append(ip)
         self.log(f"已复制IP: {ip}")
@@ -228,34 +252,62 @@ class AnchorDeviceApp:
         self.root.after(0, update)
         
     def on_distance_updated(self, distance):
-        """距离更新回调"""
-        def update():
-            # 更新显示
-            self.distance_label.config(text=f"{distance:.3f} m")
+        """距离更新回调（在测距线程中调用）"""
+        stats = self.engine.get_statistics()
+        fps = stats['fps'] if stats else 0
+        
+        # 字符串格式化在测距线程中完成，UI线程只负责设置控件
+        labels = (
+            f"{distance:.3f} m",
+            f"FPS: {stats['fps']:.1f}",
+            f"均值: {stats['mean']:.3f} m",
+            f"标准差: {stats['std']:.3f} m",
+            f"测量次数: {stats['count']}"
+        ) if stats else (f"{distance:.3f} m",)
+        record = {
+            'time': clock_str(),
+            'distance': distance,
+            'fps': fps
+        }
+        row = (record['time'], f"{distance:.3f}", f"{fps:.1f}")
+        self._pending.append((labels, record, row))
+        
+        # 合并短时间内的多次更新，只调度一次界面刷新
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.root.after(self.FLUSH_INTERVAL_MS, self._flush_ui)
             
-            # 更新统计
-            stats = self.engine.get_statistics()
-            if stats:
-                self.fps_label.config(text=f"FPS: {stats['fps']:.1f}")
-                self.mean_label.config(text=f"均值: {stats['mean']:.3f} m")
-                self.std_label.config(text=f"标准差: {stats['std']:.3f} m")
-                self.count_label.config(text=f"测量次数: {stats['count']}")
-                
-            # 添加到历史
-            self.measurements.append({
-                'time': datetime.now().strftime("%H:%M:%S.%f")[:-3],
-                'distance': distance,
-                'fps': stats['fps'] if stats else 0
-            })
+    def _flush_ui(self):
+        """批量刷新测距结果到界面"""
+        # 先清除标志再取数据，保证之后到达的结果会触发新的刷新
+        self._flush_scheduled = False
+        
+        items = []
+        while self._pending:
+            items.append(self._pending.popleft())
+        if not items:
+            return
             
-            self.history_tree.insert('', 0, values=(
-                len(self.measurements),
-                self.measurements[-1]['time'],
-                f"{distance:.3f}",
-                f"{self.measurements[-1]['fps']:.1f}"
-            ))
+        # 标签只显示最新结果
+        labels = items[-1][0]
+        self.distance_label.config(text=labels[0])
+        if len(labels) > 1:
+            self.fps_label.config(text=labels[1])
+            self.mean_label.config(text=labels[2])
+            self.std_label.config(text=labels[3])
+            self.count_label.config(text=labels[4])
             
-        self.root.after(0, update)
+        # 添加到历史
+        for _, record, row in items:
+            self.measurement_count += 1
+            record['index'] = self.measurement_count
+            self.measurements.append(record)
+            self.history_tree.insert('', 0, values=(self.measurement_count,) + row)
+            
+        # 只保留最新的若干行，避免列表过长拖慢界面
+        children = self.history_tree.get_children()
+        if len(children) > self.MAX_TREE_ROWS:
+            self.history_tree.delete(*children[self.MAX_TREE_ROWS:])
         
     def on_state_changed(self, state):
         """状态改变回调"""
@@ -288,7 +340,9 @@ class AnchorDeviceApp:
             
     def clear_history(self):
         """清除历史"""
-        self.measurements = []
+        self.measurements.clear()
+        self._pending.clear()
+        self.measurement_count = 0
         for item in self.history_tree.get_children():
             self.history_tree.delete(item)
         self.log("已清除历史记录")
@@ -303,10 +357,11 @@ class AnchorDeviceApp:
         
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                f.write("序号,时间,距离(m),FPS\n")
-                for i, m in enumerate(self.measurements, 1):
-                    f.write(f"{i},{m['time']},{m['distance']},{m['fps']}\n")
-                    
+                # 先拼接成完整字符串再一次性写入
+                f.write("序号,时间,距离(m),FPS\n" + ''.join(
+                    f"{m['index']},{m['time']},{m['distance']},{m['fps']}\n"
+                    for m in self.measurements
+                ))
             self.log(f"数据已导出到 {filename}")
             messagebox.showinfo("成功", f"数据已导出到 {filename}")
         except Exception as e:
@@ -321,6 +376,7 @@ class AnchorDeviceApp:
 
 def main():
     """主函数"""
+    setup_logging()
     root = tk.Tk()
     app = AnchorDeviceApp(root)
     root.mainloop()
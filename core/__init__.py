@@ -3,6 +3,7 @@ from .signal_processor import SignalProcessor, RangingSession
 from .audio_io import AudioIO, ContinuousRecorder
 from .network import NetworkManager, UDPBroadcaster
 from .ranging_engine import RangingEngine, SimplifiedRangingEngine
+from .log import setup_logging
 
 __all__ = [
     'SignalProcessor',
@@ -12,5 +13,6 @@ __all__ = [
     'NetworkManager',
     'UDPBroadcaster',
     'RangingEngine',
-    'SimplifiedRangingEngine'
+    'SimplifiedRangingEngine',
+    'setup_logging'
 ]
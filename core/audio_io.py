@@ -4,18 +4,52 @@
 处理麦克风录音和扬声器播放
 """
 
+import logging
+import os
+import tempfile
 import numpy as np
 import sounddevice as sd
 import threading
-import queue
 import time
 from typing import Callable, Optional
 
+from .jit import njit
+
+logger = logging.getLogger(__name__)
+
+
+@njit(nogil=True, cache=True)
+def _ring_write(buf, data, write_index, buffer_size):
+    """
+    将一块数据写入环形缓冲区
+    
+    编译后在写入过程中释放GIL，避免音频回调线程与UI线程争用
+    
+    Args:
+        buf: 环形缓冲区
+        data: 待写入的一维数据
+        write_index: 当前写入位置
+        buffer_size: 缓冲区大小
+        
+    Returns:
+        int: 新的写入位置
+    """
+    n = data.shape[0]
+    end_index = write_index + n
+    if end_index <= buffer_size:
+        buf[write_index:end_index] = data
+    else:
+        # 回绕
+        first_part = buffer_size - write_index
+        buf[write_index:] = data[:first_part]
+        buf[:end_index - buffer_size] = data[first_part:]
+    return end_index % buffer_size
+
 
 class AudioIO:
     """音频输入输出管理器"""
     
-    def __init__(self, sample_rate=44100, channels=1, blocksize=1024):
+    def __init__(self, sample_rate=44100, channels=1, blocksize=1024, ring_duration=4.0):
         """
         初始化音频IO
         
@@ -23,15 +57,26 @@ class AudioIO:
             sample_rate: 采样率
             channels: 通道数
             blocksize: 音频块大小
+            ring_duration: 录音环形缓冲区时长（秒），实际容量向上取整到2的幂
         """
         self.sample_rate = sample_rate
         self.channels = channels
         self.blocksize = blocksize
         
-        # 录音缓冲
-        self.recording_buffer = []
+        # 录音环形缓冲区（单生产者单消费者，无锁）
+        # 音频回调线程只写入数据并推进 _write_idx，读取方只读取 _write_idx，
+        # 两个索引都是单调递增的整数，取模通过掩码完成
+        ring_size = 1 << (int(sample_rate * ring_duration) - 1).bit_length()
+        self._ring = np.zeros(ring_size, dtype=np.float32)
+        self._ring_mask = ring_size - 1
+        self._write_idx = 0
+        self._read_idx = 0
         self.is_recording = False
-        self.recording_lock = threading.Lock()
+        
+        # 长时间会话录音，写入磁盘映射文件，只有正在访问的页常驻内存
+        self._session = None
+        self._session_pos = 0
+        self.session_file = None
         
         # 播放状态
         self.is_playing = False
@@ -40,8 +85,12 @@ class AudioIO:
         self.stream = None
         self.play_buffer = None
         self.play_index = 0
+        # 播放开始时对应的录音写索引，用于对齐 play_and_record 的录音窗口
+        self._play_mark = None
         
         # 回调函数
+        # on_audio_data(indata) 在音频回调线程中调用，indata 是PortAudio缓冲区的视图，
+        # 回调返回后即失效，需要保留数据时请自行 copy()
         self.on_audio_data: Optional[Callable] = None
         
     def get_devices(self):
@@ -82,27 +131,50 @@ class AudioIO:
         同时处理录音和播放
         """
         if status:
-            print(f'音频状态: {status}')
+            logger.warning('音频状态: %s', status)
+        
+        # 录音部分：写入环形缓冲区，回调中不加锁、不分配内存
+        w = self._write_idx
+        start = w & self._ring_mask
+        end = start + frames
+        if end <= len(self._ring):
+            self._ring[start:end] = indata[:, 0]
+        else:
+            # 回绕
+            first_part = len(self._ring) - start
+            self._ring[start:] = indata[:first_part, 0]
+            self._ring[:end - len(self._ring)] = indata[first_part:, 0]
+        # 数据写完后再发布新的写索引
+        self._write_idx = w + frames
+        
+        # 会话录音：顺序追加到内存映射文件，写满后不再追加
+        session = self._session
+        if session is not None:
+            pos = self._session_pos
+            n = min(frames, len(session) - pos)
+            if n > 0:
+                session[pos:pos + n] = indata[:n, 0]
+                self._session_pos = pos + n
         
-        # 录音部分
         if self.is_recording:
-            with self.recording_lock:
-                self.recording_buffer.append(indata.copy())
-            
-            # 实时回调
+            # 实时回调（零拷贝，直接传递视图）
             if self.on_audio_data:
-                self.on_audio_data(indata.copy())
-        
-        # 播放部分
-        if self.play_buffer is not None and self.play_index < len(self.play_buffer):
-            end_index = min(self.play_index + frames, len(self.play_buffer))
-            chunk = self.play_buffer[self.play_index:end_index]
+                self.on_audio_data(indata)
+        
+        # 播放部分（只读取一次 play_buffer，播放方替换缓冲区时本次回调不受影响）
+        buf = self.play_buffer
+        if buf is not None and self.play_index < len(buf):
+            if self.play_index == 0:
+                # 记录播放起点，输入输出块在同一次回调中对齐
+                self._play_mark = w
+            end_index = min(self.play_index + frames, len(buf))
+            chunk = buf[self.play_index:end_index]
             
             if len(chunk) < frames:
                 # 不足的部分填充零
                 outdata[:len(chunk), 0] = chunk
                 outdata[len(chunk):] = 0
-                self.play_index = len(self.play_buffer)
+                self.play_index = len(buf)
             else:
                 outdata[:, 0] = chunk
                 self.play_index += frames
@@ -129,8 +201,23 @@ class AudioIO:
             callback=self._audio_callback
         )
         self.stream.start()
+        self._read_idx = self._write_idx
         self.is_recording = True
         
+    def open_stream(self, input_device=None, output_device=None):
+        """
+        确保音频流已启动，已启动时直接复用
+        
+        打开/关闭PortAudio流开销较大，应在初始化时打开一次，之后的录音和播放
+        都复用这个全双工流，直到 stop_stream
+        
+        Args:
+            input_device: 输入设备ID
+            output_device: 输出设备ID
+        """
+        if self.stream is None:
+            self.start_stream(input_device, output_device)
+            
     def stop_stream(self):
         """停止音频流"""
         self.is_recording = False
@@ -149,8 +236,10 @@ class AudioIO:
         """
         if self.stream is not None:
             # 使用流播放
-            self.play_buffer = signal.astype(np.float32)
+            # 先撤下旧缓冲区再复位索引，最后装入新缓冲区，回调不会在中途重放旧信号
+            self.play_buffer = None
             self.play_index = 0
+            self.play_buffer = np.asarray(signal, dtype=np.float32)
             
             if blocking:
                 # 等待播放完成
@@ -164,26 +253,124 @@ class AudioIO:
                 
     def start_recording(self):
         """开始录音"""
-        with self.recording_lock:
-            self.recording_buffer = []
+        self._read_idx = self._write_idx
         self.is_recording = True
         
-    def stop_recording(self):
+    def stop_recording(self, out=None):
         """
         停止录音并返回录制的数据
         
+        数据从环形缓冲区一次性拷贝到输出缓冲区，不产生临时数组
+        
+        Args:
+            out: 可选的输出缓冲区（float32，长度不小于录音长度）。
+                 传入时结果写入其中并返回其视图，调用方负责在数据用完之前
+                 不再复用该缓冲区；为None时返回新分配的数组
+            
         Returns:
             numpy.ndarray: 录制的音频数据
         """
         self.is_recording = False
         
-        with self.recording_lock:
-            if self.recording_buffer:
-                recorded = np.concatenate(self.recording_buffer, axis=0)
-                self.recording_buffer = []
-                return recorded.flatten()
-            return np.array([])
+        end_idx = self._write_idx
+        n = end_idx - self._read_idx
+        if n <= 0:
+            return np.array([], dtype=np.float32)
+        if n > len(self._ring):
+            # 录音时长超过缓冲区容量，只保留最近的数据
+            logger.warning('录音超过缓冲区容量，丢弃最早的 %d 个采样点', n - len(self._ring))
+            n = len(self._ring)
+        
+        return self._copy_window(end_idx - n, n, out)
     
+    def _copy_window(self, start_idx, n, out=None):
+        """
+        将环形缓冲区中 [start_idx, start_idx + n) 的数据拷贝到输出缓冲区
+        
+        Args:
+            start_idx: 起始写索引（单调递增的绝对索引）
+            n: 采样点数，不超过环形缓冲区容量
+            out: 可选的输出缓冲区，为None时新分配一个数组
+            
+        Returns:
+            numpy.ndarray: out 的前 n 个采样点的视图
+        """
+        if out is None:
+            out = np.empty(n, dtype=np.float32)
+        elif len(out) < n:
+            raise ValueError(f'输出缓冲区太小: 需要 {n}，实际 {len(out)}')
+        
+        start = start_idx & self._ring_mask
+        stop = start + n
+        if stop <= len(self._ring):
+            np.copyto(out[:n], self._ring[start:stop])
+        else:
+            # 回绕，分两段拷贝
+            first_part = len(self._ring) - start
+            np.copyto(out[:first_part], self._ring[start:])
+            np.copyto(out[first_part:n], self._ring[:stop - len(self._ring)])
+        return out[:n]
+    
+    def start_session_recording(self, filename=None, max_duration=3600.0):
+        """
+        开始长时间会话录音
+        
+        录音数据追加到 np.memmap 映射的磁盘文件中，由操作系统页缓存管理常驻内存，
+        适合长时间运行的锚节点，需要音频流已启动
+        
+        Args:
+            filename: 录音文件路径（float32原始数据），为None时创建临时文件
+            max_duration: 最大录音时长（秒），超出部分丢弃
+            
+        Returns:
+            str: 录音文件路径
+        """
+        if filename is None:
+            fd, filename = tempfile.mkstemp(prefix='session_', suffix='.f32')
+            os.close(fd)
+            
+        samples = int(max_duration * self.sample_rate)
+        session = np.memmap(filename, dtype=np.float32, mode='w+', shape=(samples,))
+        
+        self.session_file = filename
+        self._session_pos = 0
+        self._session = session
+        return filename
+    
+    def stop_session_recording(self):
+        """
+        停止会话录音
+        
+        Returns:
+            numpy.memmap: 已录制部分的视图（仍由磁盘文件支持），未开始录音时返回None
+        """
+        session = self._session
+        if session is None:
+            return None
+        self._session = None
+        
+        session.flush()
+        return session[:self._session_pos]
+    
+    def _frames_for(self, duration):
+        """
+        把录音时长换算为采样点数，并检查环形缓冲区能否容纳
+        
+        Args:
+            duration: 录音时长（秒）
+            
+        Returns:
+            int: 采样点数
+            
+        Raises:
+            ValueError: 录音时长超过环形缓冲区容量
+        """
+        frames = int(duration * self.sample_rate)
+        if frames > len(self._ring):
+            raise ValueError(f'录音时长 {duration:.2f}s 超过环形缓冲区容量 '
+                             f'{len(self._ring) / self.sample_rate:.2f}s，请增大 ring_duration')
+        return frames
+        
     def record_for_duration(self, duration, start_callback=None):
         """
         录制指定时长的音频
@@ -197,36 +384,74 @@ class AudioIO:
         """
         frames = int(duration * self.sample_rate)
         
+        if self.stream is None or frames > len(self._ring):
+            # 没有常开的音频流（或时长超过环形缓冲区）时单独录制一次，不留下打开的流
+            if start_callback:
+                start_callback()
+            recording = sd.rec(frames, samplerate=self.sample_rate,
+                               channels=self.channels, dtype=np.float32)
+            sd.wait()
+            return recording.ravel()
+            
+        # 音频流已打开：直接从环形缓冲区取数据，不再为这次录音单独打开流
         if start_callback:
             start_callback()
+        start_idx = self._write_idx
+        
+        time.sleep(duration)
+        deadline = time.monotonic() + 1.0
+        while self._write_idx - start_idx < frames:
+            if time.monotonic() > deadline:
+                logger.warning('音频流无响应，录音数据不完整')
+                break
+            time.sleep(0.005)
             
-        recording = sd.rec(frames, samplerate=self.sample_rate, 
-                          channels=self.channels, dtype=np.float32)
-        sd.wait()
-        
-        return recording.flatten()
+        n = min(frames, self._write_idx - start_idx)
+        return self._copy_window(start_idx, n)
     
-    def play_and_record(self, signal, extra_duration=0.5):
+    def play_and_record(self, signal, extra_duration=0.5, out=None):
         """
         同时播放和录音
         
+        复用常开的双工音频流（未打开时在此打开），录音数据直接从环形缓冲区读取，
+        避免每次测量都打开/关闭PortAudio流
+        
         Args:
             signal: 要播放的信号
-            extra_duration: 额外录制时间（秒）
+            extra_duration: 额外录制时间（秒），信号时长加上它不能超过环形缓冲区容量
+            out: 可选的输出缓冲区，语义同 stop_recording
             
         Returns:
             numpy.ndarray: 录制的音频数据
         """
-        signal = signal.astype(np.float32)
+        signal = np.asarray(signal, dtype=np.float32)
         record_duration = len(signal) / self.sample_rate + extra_duration
-        frames = int(record_duration * self.sample_rate)
+        frames = self._frames_for(record_duration)
         
-        # 同时播放和录音
-        recording = sd.playrec(signal, self.sample_rate, 
-                               channels=self.channels, dtype=np.float32)
-        sd.wait()
+        self.open_stream()
         
-        return recording.flatten()
+        # 交给音频回调播放，回调在播放第一块时记录录音起点
+        # 先撤下旧缓冲区，再复位索引和播放起点，最后装入新缓冲区：
+        # 回调在这几步之间运行时既不会重放旧信号，也不会把起点记在旧信号上
+        self.play_buffer = None
+        self.play_index = 0
+        self._play_mark = None
+        self.play_buffer = signal
+        
+        # 等待录满所需长度
+        time.sleep(record_duration)
+        deadline = time.monotonic() + 1.0
+        while (self._play_mark is None or
+               self._write_idx - self._play_mark < frames):
+            if time.monotonic() > deadline:
+                logger.warning('音频流无响应，录音数据不完整')
+                break
+            time.sleep(0.005)
+            
+        if self._play_mark is None:
+            return np.array([], dtype=np.float32)
+        n = min(frames, self._write_idx - self._play_mark)
+        return self._copy_window(self._play_mark, n, out)
 
 
 class ContinuousRecorder:
@@ -252,34 +477,17 @@ class ContinuousRecorder:
         self.stream = None
         self.is_running = False
         
-        # 数据队列（用于外部处理）
-        self.data_queue = queue.Queue(maxsize=100)
-        
     def _callback(self, indata, frames, time_info, status):
         """录音回调"""
         if status:
-            print(f'录音状态: {status}')
+            logger.warning('录音状态: %s', status)
             
-        data = indata[:, 0] if len(indata.shape) > 1 else indata.flatten()
+        data = indata[:, 0] if len(indata.shape) > 1 else indata.ravel()
         
         with self.lock:
             # 写入环形缓冲区
-            end_index = self.write_index + len(data)
-            if end_index <= self.buffer_size:
-                self.buffer[self.write_index:end_index] = data
-            else:
-                # 回绕
-                first_part = self.buffer_size - self.write_index
-                self.buffer[self.write_index:] = data[:first_part]
-                self.buffer[:end_index - self.buffer_size] = data[first_part:]
-            
-            self.write_index = end_index % self.buffer_size
-        
-        # 放入队列
-        try:
-            self.data_queue.put_nowait(data.copy())
-        except queue.Full:
-            pass
+            self.write_index = _ring_write(self.buffer, data, self.write_index,
+                                           self.buffer_size)
             
     def start(self, device=None):
         """开始持续录音"""
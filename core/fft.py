@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+可选的FFTW加速
+安装了pyfftw时使用FFTW计算实数FFT（缓存计划，首次按 FFTW_MEASURE 规划），
+否则使用 scipy.fft
+"""
+
+import os
+
+from scipy.fft import next_fast_len
+
+try:
+    import pyfftw
+    from pyfftw.interfaces import scipy_fft as _fftw
+    HAS_PYFFTW = True
+except ImportError:
+    from scipy.fft import rfft, irfft
+    HAS_PYFFTW = False
+else:
+    # 同一长度的FFT计划只规划一次，之后从缓存中取
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    pyfftw.config.PLANNER_EFFORT = 'FFTW_MEASURE'
+
+    def _workers(workers):
+        """把 scipy 风格的负数线程数（-1 表示全部核心）转换为具体数量"""
+        if workers is None:
+            return 1
+        if workers < 0:
+            return max(1, (os.cpu_count() or 1) + 1 + workers)
+        return workers
+
+    def rfft(x, n=None, axis=-1, workers=None):
+        """实数FFT，参数与 scipy.fft.rfft 相同"""
+        return _fftw.rfft(x, n=n, axis=axis, workers=_workers(workers))
+
+    def irfft(x, n=None, axis=-1, workers=None, overwrite_x=False):
+        """实数逆FFT，参数与 scipy.fft.irfft 相同"""
+        return _fftw.irfft(x, n=n, axis=axis, workers=_workers(workers),
+                           overwrite_x=overwrite_x)
+
+
+__all__ = ['rfft', 'irfft', 'next_fast_len', 'HAS_PYFFTW']
@@ -4,13 +4,19 @@
 实现各种滤波算法来减少测距波动
 """
 
+import logging
 import numpy as np
 from collections import deque
 
+logger = logging.getLogger(__name__)
+
 
 class DistanceFilter:
     """距离测量滤波器"""
     
+    # 窗口不超过该大小时使用纯Python排序求中位数，比NumPy调用开销更小
+    SMALL_WINDOW = 16
+    
     def __init__(self, window_size=5, outlier_threshold=2.0):
         """
         初始化滤波器
@@ -21,7 +27,14 @@ class DistanceFilter:
         """
         self.window_size = window_size
         self.outlier_threshold = outlier_threshold
-        self.measurements = deque(maxlen=window_size)
+        # MAD判定阈值系数，1.4826是使MAD与标准差一致的系数
+        self._mad_scale = outlier_threshold * 1.4826
+        
+        # 预分配的环形缓冲区，保存最近 window_size 个测量值
+        self._buf = np.empty(window_size, dtype=np.float64)
+        self._n = 0     # 当前有效数据个数
+        self._head = 0  # 下一个写入位置
+        
         self.filtered_values = deque(maxlen=window_size)
         
     def add_measurement(self, value):
@@ -35,13 +48,16 @@ class DistanceFilter:
             float or None: 滤波后的值，如果是异常值则返回None
         """
         # 检查是否为异常值
-        if len(self.measurements) >= 3:
+        if self._n >= 3:
             if self._is_outlier(value):
-                print(f"⚠️ 检测到异常值: {value:.3f}m (被过滤)")
+                logger.debug("检测到异常值: %.3fm (被过滤)", value)
                 return None
         
         # 添加到历史记录
-        self.measurements.append(value)
+        self._buf[self._head] = value
+        self._head = (self._head + 1) % self.window_size
+        if self._n < self.window_size:
+            self._n += 1
         
         # 应用滤波
         filtered_value = self._apply_filter()
@@ -49,6 +65,48 @@ class DistanceFilter:
         
         return filtered_value
     
+    @property
+    def measurements(self):
+        """
+        窗口内的测量值（只读），按时间顺序，最后一个为最新值
+        
+        Returns:
+            list: 测量值列表
+        """
+        if self._n < self.window_size:
+            return self._buf[:self._n].tolist()
+        return self._buf[self._head:].tolist() + self._buf[:self._head].tolist()
+    
+    def _window(self):
+        """
+        获取当前窗口内的测量值（顺序无关）
+        
+        Returns:
+            list or numpy.ndarray: 小窗口返回Python列表，大窗口返回数组视图
+        """
+        if self.window_size <= self.SMALL_WINDOW:
+            return self._buf[:self._n].tolist()
+        return self._buf[:self._n]
+    
+    @staticmethod
+    def _median(values):
+        """
+        计算中位数，列表使用纯Python排序，数组使用np.median
+        
+        Args:
+            values: Python列表或NumPy数组
+            
+        Returns:
+            float: 中位数
+        """
+        if isinstance(values, np.ndarray):
+            return float(np.median(values))
+        s = sorted(values)
+        mid = len(s) // 2
+        if len(s) % 2:
+            return s[mid]
+        return (s[mid - 1] + s[mid]) / 2
+    
     def _is_outlier(self, value):
         """
         检测是否为异常值
@@ -60,26 +118,35 @@ class DistanceFilter:
         Returns:
             bool: 是否为异常值
         """
-        if len(self.measurements) < 3:
+        if self._n < 3:
             return False
         
+        values = self._window()
+        
         # 计算中位数
-        median = np.median(list(self.measurements))
+        median = self._median(values)
         
         # 计算绝对偏差
-        mad = np.median(np.abs(np.array(list(self.measurements)) - median))
+        if isinstance(values, np.ndarray):
+            mad = self._median(np.abs(values - median))
+        else:
+            mad = self._median([abs(x - median) for x in values])
+        
+        deviation = abs(value - median)
         
         # MAD为0时使用标准差方法
         if mad < 1e-6:
-            std = np.std(list(self.measurements))
+            if isinstance(values, np.ndarray):
+                std = float(np.std(values))
+            else:
+                mean = sum(values) / len(values)
+                std = (sum((x - mean) ** 2 for x in values) / len(values)) ** 0.5
             if std < 1e-6:
                 return False
-            return abs(value - median) > self.outlier_threshold * std
+            return deviation > self.outlier_threshold * std
         
         # 计算标准化绝对偏差
-        threshold = self.outlier_threshold * 1.4826 * mad  # 1.4826是使MAD与标准差一致的系数
-        
-        return abs(value - median) > threshold
+        return deviation > self._mad_scale * mad
     
     def _apply_filter(self):
         """
@@ -89,14 +156,14 @@ class DistanceFilter:
         Returns:
             float: 滤波后的值
         """
-        if len(self.measurements) == 0:
+        if self._n == 0:
             return 0.0
         
-        if len(self.measurements) == 1:
-            return self.measurements[0]
+        if self._n == 1:
+            return float(self._buf[0])
         
         # 中值滤波
-        return float(np.median(list(self.measurements)))
+        return self._median(self._window())
     
     def get_statistics(self):
         """
@@ -112,19 +179,23 @@ class DistanceFilter:
                 'count': 0
             }
         
-        values = list(self.filtered_values)
+        # 只转换一次数组，各统计量直接在同一个数组上计算
+        values = np.fromiter(self.filtered_values, dtype=np.float64,
+                             count=len(self.filtered_values))
+        mean = values.mean()
         return {
-            'mean': float(np.mean(values)),
-            'std': float(np.std(values)),
+            'mean': float(mean),
+            'std': float(np.sqrt(np.mean(np.square(values - mean)))),
             'median': float(np.median(values)),
-            'min': float(np.min(values)),
-            'max': float(np.max(values)),
+            'min': float(values.min()),
+            'max': float(values.max()),
             'count': len(values)
         }
     
     def reset(self):
         """重置滤波器"""
-        self.measurements.clear()
+        self._n = 0
+        self._head = 0
         self.filtered_values.clear()
 
 
@@ -151,26 +222,49 @@ class KalmanFilter:
         """
         更新滤波器状态
         
+        首次测量交给 update_first，之后交给 update_steady
+        
         Args:
             measurement: 新的测量值
             
         Returns:
             float: 滤波后的估计值
         """
-        if not self.is_initialized:
-            # 首次测量，直接使用
-            self.estimate = measurement
-            self.is_initialized = True
-            return self.estimate
+        if self.is_initialized:
+            return self.update_steady(measurement)
+        return self.update_first(measurement)
+    
+    def update_first(self, measurement):
+        """
+        处理首次测量，直接使用测量值作为估计
         
-        # 预测步骤
-        prediction = self.estimate
-        prediction_error = self.estimate_error + self.process_variance
+        Args:
+            measurement: 新的测量值
+            
+        Returns:
+            float: 滤波后的估计值
+        """
+        self.estimate = measurement
+        self.is_initialized = True
+        return self.estimate
+    
+    def update_steady(self, measurement):
+        """
+        稳态更新（预测 + 更新）
+        
+        Args:
+            measurement: 新的测量值
+            
+        Returns:
+            float: 滤波后的估计值
+        """
+        # 预测误差
+        pe = self.estimate_error + self.process_variance
         
-        # 更新步骤
-        kalman_gain = prediction_error / (prediction_error + self.measurement_variance)
-        self.estimate = prediction + kalman_gain * (measurement - prediction)
-        self.estimate_error = (1 - kalman_gain) * prediction_error
+        # 卡尔曼增益与状态更新
+        k = pe / (pe + self.measurement_variance)
+        self.estimate += k * (measurement - self.estimate)
+        self.estimate_error = pe - k * pe
         
         return self.estimate
     
@@ -194,14 +288,24 @@ class MovingAverageFilter:
         """
         self.window_size = window_size
         self.weighted = weighted
-        self.values = deque(maxlen=window_size)
+        
+        # 预分配的数据缓冲区，按时间顺序存放，末尾为最新值
+        self._buf = np.zeros(window_size, dtype=np.float64)
+        self._n = 0
         
         # 生成权重
         if weighted:
             self.weights = np.arange(1, window_size + 1)
             self.weights = self.weights / np.sum(self.weights)
+            
+            # 按窗口内数据个数缓存归一化后的权重，update 时直接取用
+            self._weight_cache = [None] * (window_size + 1)
+            for k in range(1, window_size + 1):
+                w = self.weights[-k:]
+                self._weight_cache[k] = w / np.sum(w)
         else:
             self.weights = None
+            self._weight_cache = None
     
     def update(self, value):
         """
@@ -213,22 +317,33 @@ class MovingAverageFilter:
         Returns:
             float: 平均后的值
         """
-        self.values.append(value)
+        # 整体左移一位后写入新值
+        self._buf[:-1] = self._buf[1:]
+        self._buf[-1] = value
+        if self._n < self.window_size:
+            self._n += 1
         
-        if len(self.values) == 0:
-            return 0.0
+        values = self._buf[-self._n:]
         
-        values_array = np.array(list(self.values))
-        
-        if self.weighted and len(self.values) > 1:
+        if self.weighted and self._n > 1:
             # 加权平均
-            weights = self.weights[-len(self.values):]
-            weights = weights / np.sum(weights)
-            return float(np.sum(values_array * weights))
+            return float(np.dot(values, self._weight_cache[self._n]))
         else:
             # 简单平均
-            return float(np.mean(values_array))
+            return float(np.mean(values))
+    
+    @property
+    def values(self):
+        """
+        窗口内的数据（只读），按时间顺序，最后一个为最新值
+        
+        Returns:
+            list: 数据列表
+        """
+        if self._n == 0:
+            return []
+        return self._buf[-self._n:].tolist()
     
     def reset(self):
         """重置滤波器"""
-        self.values.clear()
+        self._n = 0
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+可选的GPU加速
+安装了cupy且存在可用的CUDA设备时，长录音的匹配滤波（FFT、频谱相乘、逆FFT）在GPU上完成，
+否则 HAS_GPU 为 False，全部在CPU上计算
+"""
+
+try:
+    import cupy as cp
+    # 只安装了cupy而没有CUDA设备/驱动时，查询设备数量会抛出异常
+    HAS_GPU = cp.cuda.runtime.getDeviceCount() > 0
+except Exception:
+    cp = None
+    HAS_GPU = False
+
+
+__all__ = ['cp', 'HAS_GPU']
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+可选的JIT编译支持
+安装了numba时使用 numba.njit 编译热点函数，否则退化为普通Python函数
+"""
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """
+        numba.njit 的替代实现，直接返回原函数
+
+        同时支持 @njit 和 @njit(...) 两种用法
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
+
+
+__all__ = ['njit', 'HAS_NUMBA']
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+日志配置
+各线程只把日志记录放入队列，由后台监听线程统一格式化和输出，
+避免测距、网络线程在控制台IO上阻塞
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+_listener = None
+
+# 单调时钟到墙上时间的偏移，启动时取一次，之后只读单调时钟
+_CLOCK_EPOCH = time.time() - time.monotonic()
+
+
+def setup_logging(level=logging.INFO):
+    """
+    配置根日志器，使用 QueueHandler + QueueListener 异步输出到控制台
+
+    重复调用只会生效一次
+
+    Args:
+        level: 日志级别
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(
+        '%(asctime)s [%(levelname)s] %(name)s: %(message)s', '%H:%M:%S'
+    ))
+
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, console)
+    _listener.start()
+    # 退出时刷新队列中剩余的日志
+    atexit.register(_listener.stop)
+
+
+def clock_str(with_ms=True):
+    """
+    当前本地时间的字符串，界面日志和测量记录的时间戳
+
+    由单调时钟加启动时的偏移得到，手工拼接，不创建 datetime 对象、不解析格式串
+
+    Args:
+        with_ms: 是否带毫秒
+
+    Returns:
+        str: "HH:MM:SS.mmm" 或 "HH:MM:SS"
+    """
+    sec, ms = divmod(int((_CLOCK_EPOCH + time.monotonic()) * 1000), 1000)
+    tm = time.localtime(sec)
+    if with_ms:
+        return f"{tm.tm_hour:02d}:{tm.tm_min:02d}:{tm.tm_sec:02d}.{ms:03d}"
+    return f"{tm.tm_hour:02d}:{tm.tm_min:02d}:{tm.tm_sec:02d}"
+
+
+__all__ = ['setup_logging', 'clock_str']
@@ -5,25 +5,70 @@
 """
 
 import socket
-import json
+import selectors
 import threading
 import time
+from contextlib import contextmanager
 from typing import Callable, Optional
 import struct
+import logging
+
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+
+class Msg(msgspec.Struct, array_like=True):
+    """网络消息（msgpack编码，按数组形式紧凑序列化）"""
+    type: int
+    data: dict = {}
+    timestamp: float = 0.0
+
+
+def _enc_hook(obj):
+    """msgpack不支持的类型（如NumPy标量/数组）转换为Python原生类型"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise NotImplementedError(f"不支持序列化的类型: {type(obj)}")
+
+
+# 复用的编解码器
+_ENC = msgspec.msgpack.Encoder(enc_hook=_enc_hook)
+_DEC = msgspec.msgpack.Decoder(Msg)
+
+# 消息帧头：4字节大端消息长度
+_HEADER = struct.Struct('>I')
 
 
 class NetworkManager:
     """网络通信管理器"""
     
-    # 消息类型定义
-    MSG_SYNC_REQUEST = 'sync_request'      # 同步请求
-    MSG_SYNC_RESPONSE = 'sync_response'    # 同步响应
-    MSG_START_RANGING = 'start_ranging'    # 开始测距
-    MSG_CHIRP_SENT = 'chirp_sent'          # Chirp已发送
-    MSG_DETECTION_RESULT = 'detection'     # 检测结果
-    MSG_DISTANCE_RESULT = 'distance'       # 距离结果
-    MSG_HEARTBEAT = 'heartbeat'            # 心跳
-    MSG_DISCONNECT = 'disconnect'          # 断开连接
+    # 消息类型定义（小整数，直接作为处理器表的下标）
+    MSG_SYNC_REQUEST = 0       # 同步请求
+    MSG_SYNC_RESPONSE = 1      # 同步响应
+    MSG_START_RANGING = 2      # 开始测距
+    MSG_CHIRP_SENT = 3         # Chirp已发送
+    MSG_DETECTION_RESULT = 4   # 检测结果
+    MSG_DISTANCE_RESULT = 5    # 距离结果
+    MSG_HEARTBEAT = 6          # 心跳
+    MSG_DISCONNECT = 7         # 断开连接
+    
+    # 消息类型名称，用于日志输出
+    MSG_NAMES = ('sync_request', 'sync_response', 'start_ranging', 'chirp_sent',
+                 'detection', 'distance', 'heartbeat', 'disconnect')
+    
+    # 每次测量都会发送的小消息走UDP，避免TCP队头阻塞和确认延迟
+    UDP_TYPES = frozenset((MSG_DETECTION_RESULT, MSG_DISTANCE_RESULT))
+    # 超过该大小的数据报会被IP分片，改走TCP
+    MAX_DATAGRAM_SIZE = 1400
+    # 客户端UDP握手心跳的重发间隔（秒）和最多发送次数，服务器回复后停止
+    UDP_HELLO_INTERVAL = 0.5
+    UDP_HELLO_ATTEMPTS = 10
+    
+    # 接收缓冲区初始大小（字节），收到更大的消息时自动扩容
+    RECV_BUFFER_SIZE = 65536
+    # 内核套接字收发缓冲区大小（字节）
+    SOCKET_BUFFER_SIZE = 1 << 17
     
     def __init__(self, port=12345):
         """
@@ -38,12 +83,31 @@ class NetworkManager:
         self.is_server = False
         self.is_connected = False
         
-        # 接收线程
-        self.receive_thread = None
-        self.running = False
+        # UDP消息通道（与TCP使用相同端口号）
+        self.udp_socket = None
+        self._udp_peer = None  # 对方UDP地址，未知时退回TCP发送
+        self._peer_ip = None   # TCP连接对方的IP，只接受来自该IP的数据报
+        self._udp_disabled = False  # UDP丢包严重时停用，本次连接内全部走TCP
         
-        # 消息回调
-        self.message_handlers = {}
+        # 网络IO线程（接受连接、TCP和UDP接收共用一个线程）
+        self.io_thread = None
+        self.running = False
+        self._selector = None
+        self._wakeup = None  # 唤醒IO线程的套接字，注册套接字或 close() 时写入一个字节
+        
+        # TCP接收缓冲区，每个连接建立时重新分配
+        self._rx_buf = None
+        self._rx_view = None
+        self._rx_fill = 0
+        # UDP接收缓冲区
+        self._udp_buf = bytearray(self.RECV_BUFFER_SIZE)
+        self._udp_view = memoryview(self._udp_buf)
+        
+        # 消息回调表，按消息类型下标索引（时间同步消息由内部处理）
+        self.message_handlers = [None] * len(self.MSG_NAMES)
+        self.message_handlers[self.MSG_SYNC_REQUEST] = self._on_sync_request
+        self.message_handlers[self.MSG_SYNC_RESPONSE] = self._on_sync_response
+        self.message_handlers[self.MSG_HEARTBEAT] = self._on_heartbeat
         
         # 连接状态回调
         self.on_connect: Optional[Callable] = None
@@ -51,59 +115,128 @@ class NetworkManager:
         
         # 时间同步
         self.time_offset = 0  # 与对方的时间差
+        self._sync_state = None  # 进行中的同步：(请求t1集合, 样本列表, 完成事件, 请求数)
+        
+        # 发送套接字及其绑定方法，连接建立时缓存
+        self._sendall = None
+        self._sendmsg = None
         
-    def register_handler(self, msg_type: str, handler: Callable):
+        # 批量发送状态（每个线程独立）
+        self._batch_local = threading.local()
+        
+    @classmethod
+    def _tune_socket(cls, sock):
+        """
+        设置TCP连接的套接字选项
+        
+        关闭Nagle算法使小消息立即发出，增大收发缓冲区，
+        并设置接收低水位为帧头长度，减少无效唤醒
+        
+        Args:
+            sock: 已连接的TCP套接字
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, cls.SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, cls.SOCKET_BUFFER_SIZE)
+        if hasattr(socket, 'SO_RCVLOWAT'):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, _HEADER.size)
+            except OSError:
+                # 部分平台（如Windows）不支持修改该选项
+                pass
+                
+    def _set_send_socket(self, sock):
+        """
+        缓存发送套接字的绑定方法，避免每次发送时重复查找
+        
+        Args:
+            sock: 已连接的TCP套接字
+        """
+        self._sendall = sock.sendall
+        # Windows 上没有 sendmsg
+        self._sendmsg = getattr(sock, 'sendmsg', None)
+        
+    def register_handler(self, msg_type: int, handler: Callable):
         """
         注册消息处理器
         
         Args:
-            msg_type: 消息类型
+            msg_type: 消息类型（MSG_* 常量）
             handler: 处理函数
         """
         self.message_handlers[msg_type] = handler
         
-    def start_server(self, host='0.0.0.0'):
+    def start_server(self, host='0.0.0.0', reuse_port=False):
         """
         启动服务器（锚节点使用）
         
+        reuse_port 为 True 时监听套接字设置 SO_REUSEPORT，
+        多个锚节点进程（每个服务一个目标设备）可以监听同一端口，
+        由内核按连接四元组把新连接分配给各个进程。
+        此时不开启UDP通道（数据报无法保证送到对应的进程），所有消息走TCP
+        
         Args:
             host: 监听地址
+            reuse_port: 是否与其他进程共享监听端口
         """
+        self._stop_io()
         self.is_server = True
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            if hasattr(socket, 'SO_REUSEPORT'):
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            else:
+                # Windows 不支持 SO_REUSEPORT
+                logger.warning("当前平台不支持 SO_REUSEPORT，端口不能共享")
         self.socket.bind((host, self.port))
         self.socket.listen(1)
+        self.socket.setblocking(False)
         
-        print(f"服务器启动，监听端口 {self.port}")
+        # 接受连接、TCP接收、UDP接收都在同一个IO线程中完成
+        self._start_io()
+        self._register(self.socket, self._on_accept_ready)
         
-        # 启动接受连接线程
-        accept_thread = threading.Thread(target=self._accept_connections, daemon=True)
-        accept_thread.start()
+        if not reuse_port:
+            # UDP通道，对方地址在收到第一个数据报后确定
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind((host, self.port))
+            self._register(self.udp_socket, self._on_udp_ready)
         
-    def _accept_connections(self):
-        """接受客户端连接"""
-        while True:
+        logger.info("服务器启动，监听端口 %d", self.port)
+        
+    def _on_accept_ready(self, sock):
+        """监听套接字可读：接受客户端连接"""
+        try:
+            conn, address = sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+            
+        logger.info("客户端连接: %s", address)
+        
+        # 只保留一个客户端，新连接替换旧连接
+        old = self.client_socket
+        if old is not None:
+            self._unregister(old)
             try:
-                self.client_socket, address = self.socket.accept()
-                print(f"客户端连接: {address}")
-                self.is_connected = True
-                
-                if self.on_connect:
-                    self.on_connect(address)
-                
-                # 启动接收线程
-                self.running = True
-                self.receive_thread = threading.Thread(
-                    target=self._receive_loop, 
-                    args=(self.client_socket,),
-                    daemon=True
-                )
-                self.receive_thread.start()
+                old.close()
+            except OSError:
+                pass
                 
-            except Exception as e:
-                print(f"接受连接错误: {e}")
-                break
+        conn.settimeout(None)
+        self._tune_socket(conn)
+        self._set_send_socket(conn)
+        self.client_socket = conn
+        self._peer_ip = address[0]
+        self._udp_peer = None
+        self._udp_disabled = False
+        self.is_connected = True
+        
+        if self.on_connect:
+            self.on_connect(address)
+            
+        self._reset_receive_buffer()
+        self._register(conn, self._on_tcp_ready)
                 
     def connect_to_server(self, host, timeout=10):
         """
@@ -116,133 +249,514 @@ class NetworkManager:
         Returns:
             bool: 连接是否成功
         """
+        # 重连时先停掉上一次连接的IO线程（避免它永远阻塞在 select 上），并关闭旧套接字
+        self._stop_io()
+        for old in (self.socket, self.udp_socket):
+            if old is not None:
+                try:
+                    old.close()
+                except OSError:
+                    pass
         self.is_server = False
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.settimeout(timeout)
         
         try:
             self.socket.connect((host, self.port))
-            print(f"已连接到服务器 {host}:{self.port}")
+            self.socket.settimeout(None)
+            self._tune_socket(self.socket)
+            self._set_send_socket(self.socket)
+            logger.info("已连接到服务器 %s:%d", host, self.port)
             self.is_connected = True
             self.client_socket = self.socket
             
+            # UDP通道：先发一个心跳让服务器得知本机UDP地址，
+            # 收到服务器的UDP回复后才启用（服务器未开启UDP时一直走TCP）
+            self._peer_ip = self.socket.getpeername()[0]
+            self._udp_peer = None
+            self._udp_disabled = False
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind(('', 0))
+            self._start_io()
+            self._register(self.udp_socket, self._on_udp_ready)
+            self._send_udp_hello()
+            
             if self.on_connect:
                 self.on_connect((host, self.port))
             
-            # 启动接收线程
-            self.running = True
-            self.receive_thread = threading.Thread(
-                target=self._receive_loop,
-                args=(self.socket,),
-                daemon=True
-            )
-            self.receive_thread.start()
+            self._reset_receive_buffer()
+            self._register(self.socket, self._on_tcp_ready)
             
             return True
             
         except Exception as e:
-            print(f"连接失败: {e}")
+            logger.error("连接失败: %s", e)
             return False
             
-    def _receive_loop(self, sock):
-        """接收消息循环"""
-        buffer = b''
+    def _start_io(self):
+        """
+        启动网络IO线程
+        
+        所有套接字注册到同一个选择器上，由一个线程阻塞等待并分发，
+        不再为接受连接、TCP接收、UDP接收各开一个线程
+        """
+        self._selector = selectors.DefaultSelector()
+        # 使用 socketpair 而不是 os.pipe，Windows 上也能被 select
+        wake_r, self._wakeup = socket.socketpair()
+        self._selector.register(wake_r, selectors.EVENT_READ, self._on_wakeup)
+        
+        self.running = True
+        self.io_thread = threading.Thread(
+            target=self._io_loop,
+            args=(self._selector, wake_r, self._wakeup),
+            daemon=True
+        )
+        self.io_thread.start()
+        
+    def _stop_io(self):
+        """
+        停止已有的网络IO线程并等待其退出
+        
+        IO循环只在自己的选择器仍是当前选择器时运行，这里换掉选择器并唤醒它，
+        线程退出时关闭自己的选择器和唤醒套接字
+        """
+        thread = self.io_thread
+        if thread is None:
+            return
+        self._selector = None
+        self._wake()
+        if thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+            if thread.is_alive():
+                logger.warning("网络IO线程未能及时退出")
+        self.io_thread = None
+        
+    def _register(self, sock, callback):
+        """
+        将套接字注册到IO线程，可读时在IO线程中调用 callback(sock)
         
-        while self.running:
+        Args:
+            sock: 套接字
+            callback: 可读回调
+        """
+        self._selector.register(sock, selectors.EVENT_READ, callback)
+        # 唤醒 select，使部分平台（如Windows）上新注册的套接字立即生效
+        self._wake()
+        
+    def _unregister(self, sock):
+        """从IO线程中移除套接字"""
+        try:
+            self._selector.unregister(sock)
+        except (AttributeError, KeyError, ValueError):
+            # 选择器已被 _stop_io 换掉
+            pass
+            
+    def _wake(self):
+        """唤醒阻塞在 select 上的IO线程"""
+        wakeup = self._wakeup
+        if wakeup is not None:
             try:
-                sock.settimeout(1.0)
-                data = sock.recv(4096)
-                
-                if not data:
-                    print("连接已关闭")
-                    break
-                    
-                buffer += data
+                wakeup.send(b'\0')
+            except OSError:
+                pass
                 
-                # 处理完整的消息
-                while b'\n' in buffer:
-                    line, buffer = buffer.split(b'\n', 1)
+    def _on_wakeup(self, sock):
+        """唤醒套接字可读：清空数据，由循环条件判断是否退出"""
+        try:
+            sock.recv(4096)
+        except OSError:
+            pass
+            
+    def _io_loop(self, sel, wake_r, wake_w):
+        """网络IO循环，阻塞在 select 上，无需超时轮询"""
+        try:
+            while self.running and sel is self._selector:
+                for key, _ in sel.select():
                     try:
-                        message = json.loads(line.decode('utf-8'))
-                        self._handle_message(message)
-                    except json.JSONDecodeError:
-                        print(f"JSON解析错误: {line}")
-                        
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"接收错误: {e}")
-                break
+                        key.data(key.fileobj)
+                    except Exception as e:
+                        logger.exception("网络IO错误: %s", e)
+        except (OSError, ValueError) as e:
+            # 关闭过程中选择器上的套接字已失效
+            if self.running:
+                logger.error("网络IO错误: %s", e)
+        finally:
+            # 关闭时TCP连接仍然有效，需要通知断开
+            connected = any(key.data == self._on_tcp_ready
+                            for key in sel.get_map().values())
+            sel.close()
+            wake_r.close()
+            wake_w.close()
+            if self._wakeup is wake_w:
+                self._wakeup = None
                 
-        self.is_connected = False
-        if self.on_disconnect:
-            self.on_disconnect()
+        if connected:
+            self.is_connected = False
+            if self.on_disconnect:
+                self.on_disconnect()
+                
+    def _reset_receive_buffer(self):
+        """为新的TCP连接准备接收缓冲区"""
+        # 预分配的接收缓冲区，recv_into 直接写入，避免每次接收都分配新对象
+        self._rx_buf = bytearray(self.RECV_BUFFER_SIZE)
+        self._rx_view = memoryview(self._rx_buf)
+        self._rx_fill = 0  # 缓冲区中已有的数据长度
+        
+    def _on_tcp_ready(self, sock):
+        """TCP连接可读：接收数据并处理完整的消息帧"""
+        buf = self._rx_buf
+        view = self._rx_view
+        fill = self._rx_fill
+        
+        try:
+            n = sock.recv_into(view[fill:])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            if self.running:
+                logger.error("接收错误: %s", e)
+            n = 0
+            
+        if not n:
+            logger.info("连接已关闭")
+            self._unregister(sock)
+            if sock is self.client_socket:
+                self.is_connected = False
+                if self.on_disconnect:
+                    self.on_disconnect()
+            return
+            
+        fill += n
+        
+        # 处理完整的消息帧
+        off = self._dispatch_frames(buf, view, fill)
+        
+        # 未处理完的数据移到缓冲区开头
+        if off:
+            rem = fill - off
+            view[:rem] = view[off:fill]
+            fill = rem
+            
+        # 单条消息超过缓冲区大小时扩容
+        if fill >= _HEADER.size:
+            need = _HEADER.size + _HEADER.unpack_from(buf)[0]
+            if need > len(buf):
+                new_buf = bytearray(max(need, 2 * len(buf)))
+                new_buf[:fill] = view[:fill]
+                view.release()
+                self._rx_buf = new_buf
+                self._rx_view = memoryview(new_buf)
+                
+        self._rx_fill = fill
+            
+    def _dispatch_frames(self, buf, view, fill):
+        """
+        解析并处理缓冲区中所有完整的消息帧（长度前缀 + msgpack数据）
+        
+        Args:
+            buf: 接收缓冲区
+            view: 缓冲区的memoryview
+            fill: 缓冲区中有效数据长度
             
+        Returns:
+            int: 已处理的字节数
+        """
+        off = 0
+        while fill - off >= _HEADER.size:
+            (length,) = _HEADER.unpack_from(buf, off)
+            end = off + _HEADER.size + length
+            if end > fill:
+                break
+            try:
+                message = _DEC.decode(view[off + _HEADER.size:end])
+            except msgspec.DecodeError as e:
+                logger.warning("消息解析错误: %s", e)
+            else:
+                self._handle_message(message)
+            off = end
+        return off
+        
+    def _send_udp_hello(self, attempt=0):
+        """
+        客户端发送UDP握手心跳，服务器回复前按间隔重发
+        
+        服务器可能尚未接受TCP连接（此时不认识本机地址会丢弃数据报），
+        数据报本身也可能丢失，因此不能只发一次
+        
+        Args:
+            attempt: 已发送次数
+        """
+        sock = self.udp_socket
+        if (not self.is_connected or self._udp_disabled or
+                self._udp_peer is not None or sock is None):
+            return
+        try:
+            sock.sendto(b''.join(self._encode_frame(self.MSG_HEARTBEAT, None)),
+                        (self._peer_ip, self.port))
+        except OSError as e:
+            logger.debug("发送UDP握手失败: %s", e)
+            return
+        if attempt + 1 < self.UDP_HELLO_ATTEMPTS:
+            timer = threading.Timer(self.UDP_HELLO_INTERVAL, self._send_udp_hello,
+                                    args=(attempt + 1,))
+            timer.daemon = True
+            timer.start()
+        
+    def _on_udp_ready(self, sock):
+        """UDP套接字可读：一个数据报中可以包含多个消息帧"""
+        try:
+            n, addr = sock.recvfrom_into(self._udp_buf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            # 套接字已关闭，或（Windows上）对方端口不可达
+            return
+            
+        if addr[0] != self._peer_ip:
+            return
+        if self._udp_peer != addr and not self._udp_disabled:
+            # 记录对方的UDP地址
+            self._udp_peer = addr
+        self._dispatch_frames(self._udp_buf, self._udp_view, n)
+            
+    def _on_heartbeat(self, data, timestamp):
+        """
+        心跳消息
+        
+        UDP心跳用于告知对方本机地址：服务器对每个握手心跳都回复一个，
+        通知客户端UDP通道可用；回复丢失时客户端会重发握手，服务器再次回复。
+        经TCP收到 {'udp': False} 表示对方已停用UDP，本机也随之停用
+        """
+        if data and data.get('udp') is False:
+            self._disable_udp_local()
+        elif self.is_server and self._udp_peer is not None:
+            self._send_datagram(self._encode_frame(self.MSG_HEARTBEAT, None))
+            
+    def disable_udp(self):
+        """
+        停用UDP通道并通知对方，本次连接内的消息全部经TCP发送
+        
+        UDP数据报丢失后不会重发，丢包严重时由上层调用，改用可靠的TCP
+        """
+        if self._udp_disabled:
+            return
+        self._disable_udp_local()
+        # 心跳不属于 UDP_TYPES，总是经TCP发送
+        self.send_message(self.MSG_HEARTBEAT, {'udp': False})
+        
+    def _disable_udp_local(self):
+        """只在本机停用UDP通道"""
+        if not self._udp_disabled:
+            self._udp_disabled = True
+            self._udp_peer = None
+            logger.warning("UDP通道已停用，改用TCP发送")
+        
     def _handle_message(self, message):
         """处理接收到的消息"""
-        msg_type = message.get('type')
-        data = message.get('data', {})
-        timestamp = message.get('timestamp', 0)
+        msg_type = message.type
         
         # 调用注册的处理器
-        if msg_type in self.message_handlers:
+        handler = (self.message_handlers[msg_type]
+                   if 0 <= msg_type < len(self.message_handlers) else None)
+        if handler is not None:
             try:
-                self.message_handlers[msg_type](data, timestamp)
+                handler(message.data, message.timestamp)
             except Exception as e:
-                print(f"消息处理错误 [{msg_type}]: {e}")
+                logger.exception("消息处理错误 [%s]: %s", self._msg_name(msg_type), e)
         else:
-            print(f"未知消息类型: {msg_type}")
+            logger.warning("未知消息类型: %s", self._msg_name(msg_type))
+            
+    @classmethod
+    def _msg_name(cls, msg_type):
+        """获取消息类型名称（用于日志）"""
+        if 0 <= msg_type < len(cls.MSG_NAMES):
+            return cls.MSG_NAMES[msg_type]
+        return str(msg_type)
             
-    def send_message(self, msg_type: str, data: dict = None):
+    def send_message(self, msg_type: int, data: dict = None):
         """
         发送消息
         
         Args:
-            msg_type: 消息类型
+            msg_type: 消息类型（MSG_* 常量）
             data: 消息数据
             
         Returns:
             bool: 发送是否成功
         """
         if not self.is_connected:
-            print("未连接，无法发送消息")
+            logger.debug("未连接，无法发送消息")
+            return False
+            
+        frame = self._encode_frame(msg_type, data)
+        use_udp = msg_type in self.UDP_TYPES and self._udp_peer is not None
+        
+        # 批量发送中，先缓存，退出 batch 时统一发送
+        pending = getattr(self._batch_local, 'frames', None)
+        if pending is not None:
+            if use_udp:
+                self._batch_local.datagram.extend(frame)
+            else:
+                pending.extend(frame)
+            return True
+        
+        if use_udp:
+            return self._send_datagram(frame)
+        return self._send_frames(frame)
+        
+    @staticmethod
+    def _encode_frame(msg_type, data, _now=time.time, _encode=_ENC.encode,
+                      _pack=_HEADER.pack):
+        """
+        编码一条消息帧
+        
+        常用函数通过默认参数绑定为局部变量，减少发送热路径上的全局/属性查找
+        
+        Returns:
+            tuple: (帧头, 消息体)
+        """
+        payload = _encode(Msg(msg_type, data or {}, _now()))
+        return (_pack(len(payload)), payload)
+        
+    def _send_datagram(self, parts):
+        """
+        将若干消息帧合并为一个UDP数据报发送给对方，过大时改走TCP
+        
+        Args:
+            parts: bytes 列表（帧头与消息体交替）
+            
+        Returns:
+            bool: 发送是否成功
+        """
+        datagram = b''.join(parts)
+        if len(datagram) > self.MAX_DATAGRAM_SIZE:
+            return self._send_frames([datagram])
+        try:
+            self.udp_socket.sendto(datagram, self._udp_peer)
+            return True
+        except Exception as e:
+            logger.error("发送UDP消息错误: %s", e)
             return False
             
-        message = {
-            'type': msg_type,
-            'data': data or {},
-            'timestamp': time.time()
-        }
+    def _send_frames(self, parts):
+        """
+        将若干数据块通过一次系统调用发送出去
         
+        Args:
+            parts: bytes 列表（帧头与消息体交替）
+            
+        Returns:
+            bool: 发送是否成功
+        """
         try:
-            sock = self.client_socket if self.is_server else self.socket
-            msg_bytes = json.dumps(message).encode('utf-8') + b'\n'
-            sock.sendall(msg_bytes)
+            sendmsg = self._sendmsg
+            if sendmsg is not None:
+                # 分散/聚集发送，无需拼接
+                sent = sendmsg(parts)
+                total = sum(len(p) for p in parts)
+                if sent < total:
+                    self._sendall(b''.join(parts)[sent:])
+            else:
+                self._sendall(b''.join(parts))
             return True
         except Exception as e:
-            print(f"发送消息错误: {e}")
+            logger.error("发送消息错误: %s", e)
             return False
             
-    def sync_time(self):
+    @contextmanager
+    def batch(self):
+        """
+        批量发送上下文，期间 send_message 的消息合并为一次发送
+        
+        用法:
+            with network.batch():
+                network.send_message(...)
+                network.send_message(...)
+        """
+        if getattr(self._batch_local, 'frames', None) is not None:
+            # 嵌套使用时由最外层统一发送
+            yield
+            return
+            
+        self._batch_local.frames = []
+        self._batch_local.datagram = []
+        try:
+            yield
+        finally:
+            frames = self._batch_local.frames
+            datagram = self._batch_local.datagram
+            self._batch_local.frames = None
+            self._batch_local.datagram = None
+            if frames and self.is_connected:
+                self._send_frames(frames)
+            if datagram and self.is_connected:
+                self._send_datagram(datagram)
+            
+    def sync_time(self, rounds=5, timeout=0.5):
         """
         与对方进行时间同步
         
+        一次性批量发送 rounds 个同步请求，等待全部响应（或超时），
+        取往返延迟最小的样本计算时间偏移（NTP方法）
+        
+        Args:
+            rounds: 同步请求个数
+            timeout: 等待响应的超时（秒）
+            
         Returns:
-            float: 时间偏移量
+            float: 时间偏移量（对方时钟 - 本地时钟）
         """
         if not self.is_connected:
             return 0
             
-        sync_times = []
+        sent = set()
+        samples = []
+        done = threading.Event()
+        self._sync_state = (sent, samples, done, rounds)
         
-        for _ in range(5):
-            t1 = time.time()
-            self.send_message(self.MSG_SYNC_REQUEST, {'t1': t1})
-            
-            # 等待响应（这里简化处理，实际应该用事件等待）
-            time.sleep(0.1)
+        try:
+            # 所有请求合并为一次发送
+            with self.batch():
+                for _ in range(rounds):
+                    t1 = time.time()
+                    sent.add(t1)
+                    self.send_message(self.MSG_SYNC_REQUEST, {'t1': t1})
+                    
+            done.wait(timeout)
+        finally:
+            self._sync_state = None
             
+        if samples:
+            # 往返延迟最小的样本受排队影响最小，偏移估计最准确
+            _, offset = min(samples)
+            self.time_offset = offset
         return self.time_offset
+    
+    def _on_sync_request(self, data, timestamp):
+        """收到同步请求，立即回复本地接收时间"""
+        self.send_message(self.MSG_SYNC_RESPONSE, {
+            't1': data.get('t1'),
+            't2': time.time()
+        })
+        
+    def _on_sync_response(self, data, timestamp):
+        """收到同步响应，记录延迟与偏移样本，全部到齐后唤醒 sync_time"""
+        t4 = time.time()
+        state = self._sync_state
+        if state is None:
+            return
+        sent, samples, done, rounds = state
+        
+        t1 = data.get('t1')
+        if t1 not in sent:
+            return
+        # t2为对方接收时间，timestamp(t3)为对方发送时间
+        t2, t3 = data['t2'], timestamp
+        delay = (t4 - t1) - (t3 - t2)
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        samples.append((delay, offset))
+        if len(samples) >= rounds:
+            done.set()
         
     def close(self):
         """关闭连接"""
@@ -251,6 +765,9 @@ class NetworkManager:
         
         self.send_message(self.MSG_DISCONNECT)
         
+        # 唤醒IO线程使其立即退出
+        self._wake()
+        
         if self.client_socket and self.client_socket != self.socket:
             try:
                 self.client_socket.close()
@@ -263,6 +780,12 @@ class NetworkManager:
             except:
                 pass
                 
+        if self.udp_socket:
+            try:
+                self.udp_socket.close()
+            except:
+                pass
+                
     def get_local_ip(self):
         """获取本机IP地址"""
         try:
@@ -290,6 +813,25 @@ class UDPBroadcaster:
         self.is_listening = False
         self.on_device_found: Optional[Callable] = None
         
+        # 预分配的接收缓冲区（一个以太网帧大小）
+        self._recv_buf = bytearray(1500)
+        self._recv_view = memoryview(self._recv_buf)
+        
+    def _ensure_socket(self):
+        """
+        创建广播和监听共用的UDP套接字（只创建一次）
+        
+        Returns:
+            socket.socket: UDP套接字
+        """
+        if self.socket is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', self.port))
+            self.socket = sock
+        return self.socket
+        
     def start_broadcasting(self, device_info: dict, interval=1.0):
         """
         开始广播设备信息
@@ -298,16 +840,18 @@ class UDPBroadcaster:
             device_info: 设备信息
             interval: 广播间隔（秒）
         """
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock = self._ensure_socket()
+        
+        # 设备信息在会话内不变，只编码一次
+        message = _ENC.encode(device_info)
+        target = ('<broadcast>', self.port)
         
         def broadcast_loop():
             while self.is_listening:
                 try:
-                    message = json.dumps(device_info).encode('utf-8')
-                    self.socket.sendto(message, ('<broadcast>', self.port))
+                    sock.sendto(message, target)
                 except Exception as e:
-                    print(f"广播错误: {e}")
+                    logger.error("广播错误: %s", e)
                 time.sleep(interval)
                 
         self.is_listening = True
@@ -316,16 +860,17 @@ class UDPBroadcaster:
         
     def start_listening(self):
         """开始监听广播"""
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind(('', self.port))
+        sock = self._ensure_socket()
+        sock.settimeout(1.0)
+        buf = self._recv_buf
+        view = self._recv_view
         
         def listen_loop():
             while self.is_listening:
                 try:
-                    self.socket.settimeout(1.0)
-                    data, addr = self.socket.recvfrom(1024)
-                    device_info = json.loads(data.decode('utf-8'))
+                    # 接收到固定缓冲区，不为每个数据报分配新对象
+                    n, addr = sock.recvfrom_into(buf)
+                    device_info = msgspec.msgpack.decode(view[:n])
                     device_info['ip'] = addr[0]
                     
                     if self.on_device_found:
@@ -334,7 +879,7 @@ class UDPBroadcaster:
                 except socket.timeout:
                     continue
                 except Exception as e:
-                    print(f"监听错误: {e}")
+                    logger.error("监听错误: %s", e)
                     
         self.is_listening = True
         thread = threading.Thread(target=listen_loop, daemon=True)
@@ -348,12 +893,15 @@ class UDPBroadcaster:
                 self.socket.close()
             except:
                 pass
+            self.socket = None
 
 
 if __name__ == '__main__':
     # 测试网络模块
     import sys
     
+    logging.basicConfig(level=logging.INFO)
+    
     if len(sys.argv) > 1 and sys.argv[1] == 'server':
         # 服务器模式
         nm = NetworkManager()
@@ -361,9 +909,9 @@ if __name__ == '__main__':
         
         def on_msg(data, ts):
             print(f"收到消息: {data}")
-            nm.send_message('response', {'status': 'ok'})
+            nm.send_message(NetworkManager.MSG_DISTANCE_RESULT, {'status': 'ok'})
             
-        nm.register_handler('test', on_msg)
+        nm.register_handler(NetworkManager.MSG_DETECTION_RESULT, on_msg)
         
         print("服务器运行中，按Ctrl+C退出")
         try:
@@ -380,10 +928,10 @@ if __name__ == '__main__':
             def on_response(data, ts):
                 print(f"收到响应: {data}")
                 
-            nm.register_handler('response', on_response)
+            nm.register_handler(NetworkManager.MSG_DISTANCE_RESULT, on_response)
             
             # 发送测试消息
-            nm.send_message('test', {'message': 'Hello from client'})
+            nm.send_message(NetworkManager.MSG_DETECTION_RESULT, {'message': 'Hello from client'})
             
             time.sleep(2)
             nm.close()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+线程优先级
+提高录音/测距工作线程的调度优先级，减少与界面、GC等线程竞争造成的时延抖动
+"""
+
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# POSIX 实时调度优先级（SCHED_FIFO，1-99）
+_FIFO_PRIORITY = 20
+# 无法使用实时调度时退而调整的 nice 值
+_NICE_INCREMENT = -10
+
+
+def boost_thread():
+    """
+    尽量提高当前线程的优先级
+
+    Windows 上设为 THREAD_PRIORITY_HIGHEST；Linux 上优先尝试 SCHED_FIFO，
+    没有权限时退而降低 nice 值。都失败时保持原优先级，不抛出异常
+
+    Returns:
+        bool: 是否成功提高了优先级
+    """
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            # THREAD_PRIORITY_HIGHEST = 2
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 2))
+        except (AttributeError, OSError) as e:
+            logger.debug('无法提高线程优先级: %s', e)
+            return False
+
+    # Linux 上 pid=0 / nice 只作用于调用线程
+    if hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(_FIFO_PRIORITY))
+            return True
+        except OSError:
+            pass
+    try:
+        os.nice(_NICE_INCREMENT)
+        return True
+    except OSError as e:
+        logger.debug('无法提高线程优先级: %s', e)
+        return False
+
+
+__all__ = ['boost_thread']
@@ -4,13 +4,228 @@
 整合信号处理、音频IO和网络通信，实现完整的测距功能
 """
 
+import logging
+import math
 import time
 import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from typing import Callable, Optional
 from .signal_processor import SignalProcessor
 from .audio_io import AudioIO
 from .network import NetworkManager
+from .jit import njit, HAS_NUMBA
+
+logger = logging.getLogger(__name__)
+
+
+def _median5(a, b, c, d, e):
+    """
+    5个数的中位数（比较网络，6次比较，不分配内存）
+    
+    Args:
+        a, b, c, d, e: 5个数值
+        
+    Returns:
+        float: 中位数
+    """
+    if a > b:
+        a, b = b, a
+    if c > d:
+        c, d = d, c
+    if a > c:
+        a, b, c, d = c, d, a, b
+    # 此时 a 是前四个数中的最小值，不可能是中位数，用 e 替换
+    a = e
+    if a > b:
+        a, b = b, a
+    if a > c:
+        a, b, c, d = c, d, a, b
+    # a 再次为剩余四个数中的最小值，中位数为余下三个数中的最小值
+    return b if b < c else c
+
+
+# 峰值筛选时，不满足时间差约束的峰值对的误差惩罚
+_OUT_OF_RANGE_PENALTY = float(2 ** 32)
+
+
+@njit(cache=True)
+def _best_peak_pair(peaks, min_diff, max_diff, expected_diff):
+    """
+    在升序排列的峰值中寻找间隔最接近期望值的一对（逐对扫描，供numba编译）
+    
+    优先选择间隔在 [min_diff, max_diff] 内的对，没有时返回全局最接近的一对；
+    误差相同时保留先出现的一对
+    
+    Args:
+        peaks: 升序排列的峰值位置（int32数组）
+        min_diff: 最小间隔
+        max_diff: 最大间隔
+        expected_diff: 期望间隔
+        
+    Returns:
+        tuple: (i, j, 是否满足间隔约束)
+    """
+    n = peaks.shape[0]
+    best_i = 0
+    best_j = 1
+    best_err = -1
+    best_ok = False
+    for i in range(n - 1):
+        for j in range(i + 1, n):
+            diff = peaks[j] - peaks[i]
+            err = abs(diff - expected_diff)
+            ok = min_diff <= diff <= max_diff
+            # 满足约束的对总是优于不满足的，同类中误差小者优先
+            if best_err < 0 or (ok and not best_ok) or (ok == best_ok and err < best_err):
+                best_i = i
+                best_j = j
+                best_err = err
+                best_ok = ok
+    return best_i, best_j, best_ok
+
+
+def _best_peak_pair_numpy(peaks, min_diff, max_diff, expected_diff):
+    """
+    _best_peak_pair 的NumPy向量化实现（未安装numba时使用）
+    
+    Args:
+        peaks: 升序排列的峰值位置（int32数组）
+        min_diff: 最小间隔
+        max_diff: 最大间隔
+        expected_diff: 期望间隔
+        
+    Returns:
+        tuple: (i, j, 是否满足间隔约束)
+    """
+    # 一次广播计算所有峰值对的间隔
+    # diff[i, j] = peaks[j] - peaks[i]，只取 i < j 的上三角
+    n = len(peaks)
+    diff = peaks[None, :] - peaks[:, None]
+    pair = np.triu(np.ones((n, n), dtype=bool), k=1)
+    err = np.where(pair, np.abs(diff - expected_diff), np.inf)
+    in_range = (diff >= min_diff) & (diff <= max_diff)
+    
+    # 不满足约束的对加上一个足够大的惩罚，一次 argmin 即可：
+    # 存在满足约束的对时选其中最优的，否则兜底选与期望间隔最近的一对。
+    # 误差为整数且远小于 2**32，加惩罚后在 float64 中仍精确，不改变并列时的先后顺序
+    penalty = err + (~in_range) * _OUT_OF_RANGE_PENALTY
+    # argmin 按行优先取第一个最小值，与逐对比较时的先后顺序一致
+    idx = penalty.argmin()
+    i, j = np.unravel_index(idx, penalty.shape)
+    return i, j, bool(in_range.flat[idx])
+
+
+class DistanceHistory:
+    """
+    距离历史记录（环形缓冲区）
+    
+    距离、原始距离、时间戳分别存放在三个预分配的数组中，
+    写满后覆盖最旧的记录；窗口内距离的均值和方差随写入增量维护
+    """
+    
+    def __init__(self, capacity=100):
+        """
+        初始化历史记录
+        
+        Args:
+            capacity: 最多保留的记录数
+        """
+        self.capacity = capacity
+        self.distance = np.empty(capacity, dtype=np.float64)
+        self.raw_distance = np.empty(capacity, dtype=np.float64)
+        self.timestamp = np.empty(capacity, dtype=np.float64)
+        self._idx = 0    # 下一个写入位置
+        self._count = 0  # 有效记录数
+        # 窗口内距离的均值和离差平方和（Welford算法，被覆盖的值同时移出）
+        self._mean = 0.0
+        self._m2 = 0.0
+        
+    def __len__(self):
+        return self._count
+        
+    def append(self, distance, raw_distance, timestamp):
+        """
+        追加一条记录
+        
+        Args:
+            distance: 滤波后的距离
+            raw_distance: 原始测量距离
+            timestamp: 时间戳
+        """
+        i = self._idx
+        if self._count == self.capacity:
+            # 移出即将被覆盖的最旧值
+            old = float(self.distance[i])
+            n = self._count - 1
+            if n == 0:
+                self._mean = 0.0
+                self._m2 = 0.0
+            else:
+                delta = old - self._mean
+                self._mean -= delta / n
+                self._m2 -= delta * (old - self._mean)
+        else:
+            self._count += 1
+        delta = distance - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (distance - self._mean)
+        
+        self.distance[i] = distance
+        self.raw_distance[i] = raw_distance
+        self.timestamp[i] = timestamp
+        self._idx = (i + 1) % self.capacity
+            
+    def clear(self):
+        """清空记录"""
+        self._idx = 0
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        
+    def statistics(self):
+        """
+        窗口内距离的统计量
+        
+        Returns:
+            tuple: (均值, 标准差, 最小值, 最大值)，无记录时返回None
+        """
+        if self._count == 0:
+            return None
+        # 最值与顺序无关，直接取有效部分
+        valid = self.distance[:self._count]
+        return (self._mean, math.sqrt(max(self._m2, 0.0) / self._count),
+                float(valid.min()), float(valid.max()))
+        
+    def _ordered(self, arr):
+        """按时间顺序（旧到新）返回有效数据"""
+        if self._count < self.capacity:
+            return arr[:self._count]
+        return np.roll(arr, -self._idx)
+        
+    def arrays(self):
+        """
+        获取按时间顺序排列的数据
+        
+        Returns:
+            tuple: (距离, 原始距离, 时间戳) 三个数组
+        """
+        return (self._ordered(self.distance),
+                self._ordered(self.raw_distance),
+                self._ordered(self.timestamp))
+        
+    def as_records(self):
+        """
+        以字典列表形式返回记录（旧到新），兼容原来的记录格式
+        
+        Returns:
+            list: [{'distance', 'raw_distance', 'timestamp'}, ...]
+        """
+        return [
+            {'distance': d, 'raw_distance': r, 'timestamp': t}
+            for d, r, t in zip(*(a.tolist() for a in self.arrays()))
+        ]
 
 
 class RangingEngine:
@@ -23,6 +238,15 @@ class RangingEngine:
     STATE_RECEIVING = 'receiving'
     STATE_PROCESSING = 'processing'
     
+    # 收到锚节点发声通知后，额外等待的传播与设备延迟余量（秒）
+    CHIRP_TAIL = 0.3
+    
+    # 最大有效测量距离（米）
+    MAX_DISTANCE = 50.0
+    
+    # 连续这么多轮因缺少对方结果而作废（UDP数据报丢失）后，改用TCP发送结果
+    MAX_EXPIRED_ROUNDS = 3
+    
     def __init__(self, device_role='target', sample_rate=44100):
         """
         初始化测距引擎
@@ -48,15 +272,39 @@ class RangingEngine:
         self.ranging_interval = 0.1  # 测距间隔（秒）
         self.record_duration = 1.0   # 录音时长（秒），进一步延长以确保收到对方Chirp
         
+        # 录音数据缓冲区（双缓冲），后台处理上一轮录音时，下一轮写入另一块
+        rec_len = int(self.sample_rate * (self.record_duration + 1.0))
+        self._rec_bufs = (np.empty(rec_len, dtype=np.float32),
+                          np.empty(rec_len, dtype=np.float32))
+        self._rec_idx = 0
+        
+        # 信号检测在单独的处理线程中进行，与下一轮录音重叠（最多一轮在处理中）
+        self._proc_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ranging-proc')
+        self._pending_detection = None
+        # 锚节点的测距响应（录音、等待、播放）在单独的线程中执行，
+        # 不占用网络IO线程，两次 sleep 期间仍能收发消息和处理时间同步
+        self._anchor_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='anchor-ranging')
+        
         # 测量数据
         self.local_detections = []   # 本地检测结果
         self.remote_detections = []  # 远程检测结果
+        
+        # 测量轮次配对：本地与远程检测结果属于同一轮（measurement_id）时才计算距离
+        self._round_lock = threading.Lock()
+        self._current_round = None   # 锚节点当前响应的轮次
+        self._local_round = None
+        self._remote_round = None
+        self._computed_round = None
+        self._expired_rounds = 0     # 连续作废的轮次数
         self.current_distance = None
-        self.distance_history = []
+        self.distance_history = DistanceHistory(100)  # 只保留最近100条记录
         
         # 滑动窗口滤波器参数
         self.filter_window_size = 5  # 滤波窗口大小
-        self.recent_distances = []   # 最近的测量值，用于滤波
+        # 最近的测量值，用于滤波（预分配的环形缓冲区，新值覆盖最旧的值）
+        self.recent_distances = [0.0] * self.filter_window_size
+        self._rd_idx = 0    # 下一个写入位置
+        self._rd_count = 0  # 窗口中的有效值个数
         self.use_median_filter = True  # 使用中值滤波去除异常值
         
         # 统计数据
@@ -75,6 +323,9 @@ class RangingEngine:
         # 测距线程
         self.ranging_thread = None
         
+        # 锚节点已播放本轮Chirp的通知
+        self._chirp_sent = threading.Event()
+        
         # 注册网络消息处理器
         self._setup_network_handlers()
         
@@ -111,23 +362,26 @@ class RangingEngine:
         """断开连接回调"""
         self.is_connected = False
         self.stop_ranging()
+        self.audio.stop_stream()
         if self.on_connection_changed:
             self.on_connection_changed(False, None)
             
     def _on_start_ranging(self, data, timestamp):
         """收到开始测距消息"""
         if self.device_role == 'anchor':
-            # 锚节点收到目标设备的测距请求
-            self._do_anchor_ranging()
+            # 锚节点收到目标设备的测距请求，交给测距线程执行
+            self._anchor_pool.submit(self._do_anchor_ranging, data.get('measurement_id'))
             
     def _on_chirp_sent(self, data, timestamp):
         """收到对方已发送Chirp的通知"""
-        pass  # 用于同步
+        if data.get('measurement_id') == self.measurement_count:
+            self._chirp_sent.set()
         
     def _on_detection_result(self, data, timestamp):
         """收到对方的检测结果"""
         self.remote_detections = self._to_int_list(data.get('detections', []))
-        self._calculate_distance()
+        self._remote_round = data.get('measurement_id')
+        self._try_calculate_distance()
         
     def _on_distance_result(self, data, timestamp):
         """收到距离计算结果"""
@@ -147,14 +401,15 @@ class RangingEngine:
         """确保列表中的元素为Python int，避免JSON序列化np.int64出错"""
         return [int(v) for v in values]
             
-    def start_server(self, host='0.0.0.0'):
+    def start_server(self, host='0.0.0.0', reuse_port=False):
         """
         以服务器模式启动（锚节点）
         
         Args:
             host: 监听地址
+            reuse_port: 是否与其他锚节点进程共享监听端口（SO_REUSEPORT）
         """
-        self.network.start_server(host)
+        self.network.start_server(host, reuse_port)
         
     def connect_to_anchor(self, host, timeout=10):
         """
@@ -195,7 +450,13 @@ class RangingEngine:
         self._set_state(self.STATE_IDLE)
         
     def _ranging_loop(self):
-        """测距主循环"""
+        """
+        测距主循环
+        
+        按绝对截止时间调度（单调时钟），每轮耗时的波动不会累积成周期漂移；
+        某轮超时落后时从当前时间重新对齐，不补跑
+        """
+        next_deadline = time.monotonic()
         while self.is_ranging and self.is_connected:
             try:
                 if self.device_role == 'target':
@@ -205,10 +466,15 @@ class RangingEngine:
                     time.sleep(0.1)
                     
                 # 控制测距频率
-                time.sleep(self.ranging_interval)
+                next_deadline += self.ranging_interval
+                delay = next_deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_deadline = time.monotonic()
                 
             except Exception as e:
-                print(f"测距错误: {e}")
+                logger.error("测距错误: %s", e)
                 if self.on_error:
                     self.on_error(str(e))
                     
@@ -217,14 +483,13 @@ class RangingEngine:
         从检测到的峰值中筛选出最可能的两个峰值
         根据设备角色和预期的时序进行筛选
         """
-        # 始终转换为 numpy 数组进行计算
-        peaks = np.array(peaks, dtype=int)
+        # 始终转换为 numpy 数组进行计算（采样点索引用 int32 足够，配对矩阵内存减半）
+        peaks = np.ascontiguousarray(peaks, dtype=np.int32)
 
         if len(peaks) < 2:
             return [int(x) for x in peaks]
 
-        # 转换为排序后的数组
-        peaks = np.sort(peaks)
+        # 调用方（detect_chirp）保证峰值已按时间升序排列
         
         # 预期的时间差范围 (采样点)
         # Target: 自身播放(0.1s)与锚节点(0.6s)的间隔约0.5s，留出 ToF、驱动延迟裕量
@@ -238,35 +503,17 @@ class RangingEngine:
 
         expected_diff = int(self.sample_rate * 0.5)
 
-        # 寻找与期望最接近的匹配对
-        best_in_range = None  # 满足约束的最佳对
-        best_in_range_err = None
-        best_any = None       # 不满足约束时的兜底对
-        best_any_err = None
-
-        for i in range(len(peaks)):
-            for j in range(i + 1, len(peaks)):
-                diff = peaks[j] - peaks[i]
-                err = abs(diff - expected_diff)
-
-                if min_diff <= diff <= max_diff:
-                    if best_in_range is None or err < best_in_range_err:
-                        best_in_range = (peaks[i], peaks[j])
-                        best_in_range_err = err
-                # 记录全局最优，确保至少返回一对
-                if best_any is None or err < best_any_err:
-                    best_any = (peaks[i], peaks[j])
-                    best_any_err = err
-
-        if best_in_range is not None:
-            return [int(best_in_range[0]), int(best_in_range[1])]
-
-        # 兜底：即使不在范围内，也返回与期望间隔最近的一对，避免空列表
-        if best_any is not None:
-            print(f"[{self.device_role}] 未找到符合时间差约束的峰值对，使用兜底结果。Peaks: {peaks}, Range: [{min_diff}, {max_diff}], chosen diff: {int(best_any[1]-best_any[0])}")
-            return [int(best_any[0]), int(best_any[1])]
-
-        return []
+        # 寻找与期望最接近的匹配对（有numba时使用编译的逐对扫描，峰值很少时比广播更快）
+        if HAS_NUMBA:
+            i, j, ok = _best_peak_pair(peaks, min_diff, max_diff, expected_diff)
+        else:
+            i, j, ok = _best_peak_pair_numpy(peaks, min_diff, max_diff, expected_diff)
+        
+        if not ok:
+            # 兜底：即使不在范围内，也返回与期望间隔最近的一对，避免空列表
+            logger.warning("[%s] 未找到符合时间差约束的峰值对，使用兜底结果。Peaks: %s, Range: [%d, %d], chosen diff: %d",
+                           self.device_role, peaks, min_diff, max_diff, int(peaks[j] - peaks[i]))
+        return [int(peaks[i]), int(peaks[j])]
 
     def _do_target_ranging(self):
         """目标设备执行测距"""
@@ -276,11 +523,12 @@ class RangingEngine:
         # 生成测距信号
         signal = self.signal_processor.generate_ranging_signal()
         
-        # 启动音频流和录音
-        self.audio.start_stream()
+        # 启动音频流（常开，跨测量复用）和录音
+        self.audio.open_stream()
         self.audio.start_recording()
         
         # 通知锚节点准备
+        self._chirp_sent.clear()
         self.network.send_message(NetworkManager.MSG_START_RANGING, {
             'measurement_id': self.measurement_count
         })
@@ -294,81 +542,161 @@ class RangingEngine:
         # 持续录音，确保覆盖：
         # 1. 自己的声音 (T+0.1)
         # 2. 锚节点的声音 (T+0.6 + ToF)
-        # 总共等待 1.2秒 足够覆盖
-        time.sleep(1.2)
-        
-        # 停止录音和流
-        recorded = self.audio.stop_recording()
-        self.audio.stop_stream()
-        
-        # 处理信号
-        self._set_state(self.STATE_PROCESSING)
-        # 降低阈值以提高检测灵敏度
-        raw_detections, correlation = self.signal_processor.detect_chirp(recorded, threshold_ratio=0.05)
+        # 锚节点播放后会发送通知，收到后只需再等待信号时长和余量；
+        # 最多等待 1.2秒，超时即按原固定时长处理
+        if self._chirp_sent.wait(timeout=1.2):
+            time.sleep(len(signal) / self.sample_rate + self.CHIRP_TAIL)
         
-        # 筛选峰值
-        detections = self._to_int_list(self._filter_peaks(raw_detections))
+        # 停止录音（音频流保持打开）
+        recorded = self.audio.stop_recording(out=self._next_rec_buf())
         
-        # 调试输出
-        print(f"[Target] 原始峰值: {raw_detections} -> 筛选后: {detections}")
-        
-        self.local_detections = detections
-        
-        # 发送检测结果给锚节点
-        self.network.send_message(NetworkManager.MSG_DETECTION_RESULT, {
-            'detections': detections,
-            'measurement_id': self.measurement_count
-        })
+        # 交给处理线程检测并发送结果，测距线程直接进入下一轮
+        self._submit_detection(recorded, self.measurement_count, 'Target')
         
-    def _do_anchor_ranging(self):
-        """锚节点执行测距响应"""
-        self._set_state(self.STATE_RECEIVING)
-        
-        # 生成信号
-        signal = self.signal_processor.generate_ranging_signal()
-        
-        # 启动音频流和录音
-        self.audio.start_stream()
-        self.audio.start_recording()
-        
-        # 等待目标设备播放并声音到达
-        # 目标在 T+0.1 播放
-        # 我们在 T+0.6 播放，确保顺序：Target(Other) -> Anchor(Self)
-        time.sleep(0.6)
+    def _do_anchor_ranging(self, measurement_id):
+        """
+        锚节点执行测距响应（在锚节点测距线程中执行）
         
-        self._set_state(self.STATE_SENDING)
-        self.audio.play_sound(signal)
+        Args:
+            measurement_id: 目标设备请求的测量轮次
+        """
+        try:
+            self._current_round = measurement_id
+            self._set_state(self.STATE_RECEIVING)
+            
+            # 生成信号
+            signal = self.signal_processor.generate_ranging_signal()
+            
+            # 启动音频流（常开，跨测量复用）和录音
+            self.audio.open_stream()
+            self.audio.start_recording()
+            
+            # 等待目标设备播放并声音到达
+            # 目标在 T+0.1 播放
+            # 我们在 T+0.6 播放，确保顺序：Target(Other) -> Anchor(Self)
+            time.sleep(0.6)
+            
+            self._set_state(self.STATE_SENDING)
+            self.audio.play_sound(signal)
+            
+            # 通知目标设备本轮Chirp已播放
+            self.network.send_message(NetworkManager.MSG_CHIRP_SENT, {
+                'measurement_id': self._current_round
+            })
+            
+            # 等待播放完成和余量
+            time.sleep(0.6)
+            
+            # 停止录音（音频流保持打开）
+            recorded = self.audio.stop_recording(out=self._next_rec_buf())
+            
+            # 交给处理线程检测并发送结果，测距线程不被信号处理阻塞
+            self._submit_detection(recorded, self._current_round, 'Anchor')
+        except Exception as e:
+            # 在线程池中执行，异常不会自动输出
+            logger.exception("锚节点测距失败: %s", e)
+        
+    def _next_rec_buf(self):
+        """轮换使用两块录音缓冲区"""
+        self._rec_idx ^= 1
+        return self._rec_bufs[self._rec_idx]
+        
+    def _submit_detection(self, recorded, measurement_id, tag):
+        """
+        提交一轮录音到处理线程
         
-        # 等待播放完成和余量
-        time.sleep(0.6)
+        先等待上一轮处理完成，保证处理中的录音所在缓冲区不会被覆盖
         
-        # 停止录音
-        recorded = self.audio.stop_recording()
-        self.audio.stop_stream()
+        Args:
+            recorded: 录音数据（录音缓冲区的视图）
+            measurement_id: 测量轮次
+            tag: 日志中的设备标识
+        """
+        pending = self._pending_detection
+        if pending is not None:
+            pending.result()
+        self._pending_detection = self._proc_pool.submit(
+            self._process_recording, recorded, measurement_id, tag
+        )
         
-        # 处理信号
-        self._set_state(self.STATE_PROCESSING)
-        # 降低阈值以提高检测灵敏度
-        raw_detections, correlation = self.signal_processor.detect_chirp(recorded, threshold_ratio=0.05)
+    def _process_recording(self, recorded, measurement_id, tag):
+        """
+        检测录音中的Chirp并发送本轮检测结果（在处理线程中执行）
         
-        # 筛选峰值
-        detections = self._to_int_list(self._filter_peaks(raw_detections))
+        Args:
+            recorded: 录音数据
+            measurement_id: 测量轮次
+            tag: 日志中的设备标识
+        """
+        try:
+            self._set_state(self.STATE_PROCESSING)
+            # 降低阈值以提高检测灵敏度
+            recorded = np.ascontiguousarray(recorded, dtype=np.float32)
+            raw_detections, correlation = self.signal_processor.detect_chirp(recorded, threshold_ratio=0.05)
+            
+            # 筛选峰值
+            detections = self._to_int_list(self._filter_peaks(raw_detections))
+            
+            # 调试输出
+            logger.debug("[%s] 原始峰值: %s -> 筛选后: %s", tag, raw_detections, detections)
+            
+            self.local_detections = detections
+            self._expire_round(measurement_id)
+            
+            # 发送检测结果；若对方结果已先到达，距离结果合并在同一次发送中
+            with self.network.batch():
+                self.network.send_message(NetworkManager.MSG_DETECTION_RESULT, {
+                    'detections': detections,
+                    'measurement_id': measurement_id
+                })
+                self._try_calculate_distance()
+                
+        except Exception as e:
+            logger.error("信号处理错误: %s", e)
+            if self.on_error:
+                self.on_error(str(e))
         
-        # 调试输出
-        print(f"[Anchor] 原始峰值: {raw_detections} -> 筛选后: {detections}")
+    def _expire_round(self, measurement_id):
+        """
+        开始新一轮，上一轮若未等到对方结果即作废
         
-        self.local_detections = detections
+        检测结果和距离结果经UDP发送，丢失后不会重发；连续作废
+        MAX_EXPIRED_ROUNDS 轮后停用UDP，之后的结果经TCP可靠送达
         
-        # 发送检测结果
-        self.network.send_message(NetworkManager.MSG_DETECTION_RESULT, {
-            'detections': detections
-        })
+        Args:
+            measurement_id: 新的测量轮次
+        """
+        with self._round_lock:
+            previous = self._local_round
+            expired = previous is not None and previous != self._computed_round
+            self._local_round = measurement_id
+            if expired:
+                self._expired_rounds += 1
+            else:
+                self._expired_rounds = 0
+            expired_rounds = self._expired_rounds
+        if not expired:
+            return
+        logger.warning("第 %s 轮未收到对方检测结果，已作废", previous)
+        if expired_rounds >= self.MAX_EXPIRED_ROUNDS:
+            self.network.disable_udp()
+        
+    def _try_calculate_distance(self):
+        """本轮的本地和远程检测结果都到齐后计算距离，每轮只计算一次"""
+        with self._round_lock:
+            current = self._local_round
+            if (current is None or current != self._remote_round or
+                    current == self._computed_round):
+                return
+            self._computed_round = current
+        self._calculate_distance()
         
     def _calculate_distance(self):
         """计算距离 - 增强版本，加入有效性验证"""
         # 检查检测结果是否有效
         if len(self.local_detections) < 2 or len(self.remote_detections) < 2:
-            print(f"检测点不足: local={len(self.local_detections)}, remote={len(self.remote_detections)}")
+            logger.warning("检测点不足: local=%d, remote=%d",
+                           len(self.local_detections), len(self.remote_detections))
             return
         
         # 使用BeepBeep算法
@@ -389,13 +717,19 @@ class RangingEngine:
             t_a1 = self.remote_detections[0]
             t_a3 = self.remote_detections[1]
             
-        distance = self.signal_processor.calculate_distance_beepbeep(
-            t_a1, t_a3, t_b1, t_b3
-        )
+        # 先用采样点差值做粗检：明显超出量程的测量直接丢弃，不必换算距离
+        raw_diff = (t_a3 - t_a1) - (t_b3 - t_b1)
+        sp = self.signal_processor
+        max_raw_diff = self.MAX_DISTANCE * 2 * sp.sample_rate / sp.speed_of_sound
+        if abs(raw_diff) > max_raw_diff:
+            logger.warning("时间差异常: %d 采样点，丢弃此次测量", raw_diff)
+            return
+            
+        distance = sp.calculate_distance_beepbeep(t_a1, t_a3, t_b1, t_b3)
         
         # 验证距离是否在合理范围内
-        if distance < 0 or distance > 50:  # 最大50米
-            print(f"计算距离异常: {distance:.3f}m，丢弃此次测量")
+        if distance < 0 or distance > self.MAX_DISTANCE:
+            logger.warning("计算距离异常: %.3fm，丢弃此次测量", distance)
             return
         
         self._update_distance(distance)
@@ -409,31 +743,30 @@ class RangingEngine:
             
     def _update_distance(self, distance):
         """更新距离结果，加入滤波处理"""
-        # 将原始测量值加入滤波窗口
-        self.recent_distances.append(distance)
-        if len(self.recent_distances) > self.filter_window_size:
-            self.recent_distances.pop(0)
-        
-        # 应用滤波
-        if self.use_median_filter and len(self.recent_distances) >= 3:
-            # 中值滤波：去除异常值的效果更好
-            filtered_distance = np.median(self.recent_distances)
-        elif len(self.recent_distances) >= 2:
+        # 将原始测量值写入滤波窗口
+        window = self.recent_distances
+        size = len(window)
+        window[self._rd_idx] = distance
+        self._rd_idx = (self._rd_idx + 1) % size
+        if self._rd_count < size:
+            self._rd_count += 1
+        count = self._rd_count
+        
+        # 应用滤波（中值与均值与顺序无关，直接使用缓冲区内容）
+        # 窗口很小，使用statistics模块直接得到Python float，避免创建NumPy数组
+        if self.use_median_filter and count == size == 5:
+            # 中值滤波：去除异常值的效果更好（常见的满窗口情况使用比较网络）
+            filtered_distance = _median5(*window)
+        elif self.use_median_filter and count >= 3:
+            filtered_distance = statistics.median(window if count == size else window[:count])
+        elif count >= 2:
             # 简单移动平均
-            filtered_distance = np.mean(self.recent_distances)
+            filtered_distance = statistics.fmean(window if count == size else window[:count])
         else:
             filtered_distance = distance
         
         self.current_distance = filtered_distance
-        self.distance_history.append({
-            'distance': filtered_distance,
-            'raw_distance': distance,
-            'timestamp': time.time()
-        })
-        
-        # 只保留最近100条记录
-        if len(self.distance_history) > 100:
-            self.distance_history = self.distance_history[-100:]
+        self.distance_history.append(filtered_distance, distance, time.time())
             
         # 更新FPS
         self.fps_count += 1
@@ -464,7 +797,7 @@ class RangingEngine:
         signal = self.signal_processor.generate_ranging_signal()
         
         # 播放并录音
-        recorded = self.audio.play_and_record(signal, extra_duration=0.5)
+        recorded = self.audio.play_and_record(signal, extra_duration=0.5, out=self._next_rec_buf())
         
         # 检测
         detections, _ = self.signal_processor.detect_chirp(recorded)
@@ -479,22 +812,22 @@ class RangingEngine:
         
     def get_statistics(self):
         """
-        获取测距统计数据
+        获取测距统计数据（最近100条历史记录）
         
         Returns:
             dict: 统计数据
         """
-        if not self.distance_history:
+        stats = self.distance_history.statistics()
+        if stats is None:
             return None
             
-        distances = [d['distance'] for d in self.distance_history]
-        
+        mean, std, lo, hi = stats
         return {
-            'count': len(distances),
-            'mean': np.mean(distances),
-            'std': np.std(distances),
-            'min': np.min(distances),
-            'max': np.max(distances),
+            'count': len(self.distance_history),
+            'mean': mean,
+            'std': std,
+            'min': lo,
+            'max': hi,
             'fps': self.fps,
             'success_rate': self.successful_count / max(1, self.measurement_count)
         }
@@ -506,6 +839,9 @@ class RangingEngine:
     def close(self):
         """关闭引擎"""
         self.stop_ranging()
+        self._anchor_pool.shutdown(wait=False, cancel_futures=True)
+        self._proc_pool.shutdown(wait=False)
+        self.audio.stop_stream()
         self.network.close()
 
 
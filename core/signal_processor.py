@@ -9,10 +9,70 @@ from scipy import signal
 from scipy.io import wavfile
 import time
 
+from .fft import next_fast_len, rfft, irfft
+from .jit import njit, HAS_NUMBA
+from .gpu import cp, HAS_GPU
+
+
+@njit(cache=True, nogil=True)
+def _abs_max_inplace(x):
+    """
+    原地取绝对值并返回最大值（一次遍历，供numba编译）
+    
+    Args:
+        x: 一维数组，会被原地修改
+        
+    Returns:
+        float: 绝对值的最大值，空数组返回0
+    """
+    peak = 0.0
+    for i in range(x.shape[0]):
+        v = abs(x[i])
+        x[i] = v
+        if v > peak:
+            peak = v
+    return peak
+
+
+@njit(cache=True)
+def _greedy_peaks(order, min_distance, count):
+    """
+    按给定顺序贪心选取相互间隔不小于 min_distance 的位置（供numba编译）
+    
+    Args:
+        order: 候选位置，按优先级从高到低排列
+        min_distance: 最小间隔（采样点）
+        count: 需要选取的数量
+        
+    Returns:
+        numpy.ndarray: 选中的位置（按选中顺序）
+    """
+    picked = np.empty(count, dtype=np.int64)
+    k = 0
+    for i in range(order.shape[0]):
+        idx = order[i]
+        ok = True
+        for j in range(k):
+            if abs(idx - picked[j]) < min_distance:
+                ok = False
+                break
+        if ok:
+            picked[k] = idx
+            k += 1
+            if k >= count:
+                break
+    return picked[:k]
+
 
 class SignalProcessor:
     """声波信号处理器"""
     
+    # FFT使用的线程数（-1 表示使用全部CPU核心）
+    FFT_WORKERS = -1
+    # 录音不短于该长度（采样点）且有可用GPU时，匹配滤波在GPU上计算，
+    # 较短的录音计算量不足以抵消主机与显存之间的传输开销
+    GPU_MIN_SAMPLES = 32768
+    
     def __init__(self, sample_rate=44100, speed_of_sound=343.0):
         """
         初始化信号处理器
@@ -35,50 +95,239 @@ class SignalProcessor:
         # 生成参考Chirp信号
         self.reference_chirp = self._generate_chirp()
         
+        # 带通滤波器（二阶节形式），只保留Chirp频率范围，参数固定只需设计一次
+        self._bandpass_sos = self._design_bandpass()
+        # 单位阶跃稳态下的滤波器初始状态，按首个采样点缩放后使用，避免起始瞬态
+        self._bandpass_zi = signal.sosfilt_zi(self._bandpass_sos).astype(np.float32)
+        
+        # 测距信号固定不变，生成一次后复用
+        self._ranging_signal = None
+        
+        # 匹配滤波器频谱缓存（FFT长度 -> 反转参考Chirp的单精度频谱）
+        self._ref_fft_cache = {}
+        # 同一频谱在显存中的副本（FFT长度 -> cupy数组），只在使用GPU时填充
+        self._ref_fft_gpu_cache = {}
+        
+        # 单向滤波使互相关峰整体后移的采样点数，检测结果中扣除
+        self._filter_delay = self._measure_filter_delay()
+        
     def _generate_chirp(self):
         """
         生成Chirp信号（线性调频信号）
         
+        相位、汉宁窗在同一个缓冲区中原地计算，只额外分配窗函数一个数组
+        
         Returns:
             numpy.ndarray: Chirp信号数组
         """
-        t = np.linspace(0, self.chirp_duration, 
-                       int(self.sample_rate * self.chirp_duration), 
-                       endpoint=False)
-        
-        # 生成线性调频信号
-        chirp_signal = signal.chirp(t, f0=self.chirp_f0, f1=self.chirp_f1, 
-                                    t1=self.chirp_duration, method='linear')
-        
-        # 应用汉宁窗减少频谱泄漏
-        window = np.hanning(len(chirp_signal))
-        chirp_signal = chirp_signal * window
+        n = int(self.sample_rate * self.chirp_duration)
+        t = np.arange(n) * (self.chirp_duration / n)
+        
+        # 线性调频信号：cos(2π(f0·t + k/2·t²))，与 signal.chirp(method='linear') 相同
+        k = (self.chirp_f1 - self.chirp_f0) / self.chirp_duration
+        chirp_signal = t * (0.5 * k)
+        chirp_signal += self.chirp_f0
+        chirp_signal *= t
+        chirp_signal *= 2 * np.pi
+        np.cos(chirp_signal, out=chirp_signal)
+        
+        # 应用汉宁窗减少频谱泄漏（与 np.hanning 相同的对称窗）
+        window = np.arange(n) * (2 * np.pi / (n - 1))
+        np.cos(window, out=window)
+        window *= -0.5
+        window += 0.5
+        chirp_signal *= window
         
         # 归一化
-        chirp_signal = chirp_signal / np.max(np.abs(chirp_signal))
+        chirp_signal /= np.max(np.abs(chirp_signal))
         
         return chirp_signal.astype(np.float32)
     
+    def _design_bandpass(self):
+        """
+        设计Chirp频段的4阶巴特沃斯带通滤波器
+        
+        系数使用单精度，使滤波在 float32 下进行，不会把录音提升为 float64
+        
+        Returns:
+            numpy.ndarray: 二阶节（SOS）系数
+        """
+        nyquist = self.sample_rate / 2
+        low = (self.chirp_f0 - 1000) / nyquist
+        high = min((self.chirp_f1 + 1000) / nyquist, 0.99)
+        sos = signal.butter(4, [low, high], btype='band', output='sos')
+        return sos.astype(np.float32)
+    
+    def _bandpass(self, x):
+        """
+        单次前向带通滤波
+        
+        只做一遍 sosfilt，不做反向滤波和边缘填充；由此产生的群时延
+        在Chirp频段内近似恒定，由 _filter_delay 统一补偿
+        
+        Args:
+            x: 一维单精度信号
+            
+        Returns:
+            numpy.ndarray: 滤波后的信号
+        """
+        if len(x) == 0:
+            return x
+        filtered, _ = signal.sosfilt(self._bandpass_sos, x, zi=self._bandpass_zi * x[0])
+        return filtered
+    
+    def _measure_filter_delay(self):
+        """
+        测量单向带通滤波对互相关峰位置造成的固定延迟
+        
+        Returns:
+            int: 延迟（采样点）
+        """
+        m = len(self.reference_chirp)
+        probe = np.zeros(4 * m, dtype=np.float32)
+        probe[m:2 * m] = self.reference_chirp
+        ref_peak = np.argmax(np.abs(self._matched_filter(probe)))
+        filtered_peak = np.argmax(np.abs(self._matched_filter(self._bandpass(probe))))
+        return int(filtered_peak - ref_peak)
+    
     def generate_ranging_signal(self):
         """
         生成用于测距的完整信号
         包含静音段 + Chirp信号 + 静音段
         
+        信号只在第一次调用时生成，之后返回同一个只读数组
+        
+        Returns:
+            numpy.ndarray: 测距信号（只读）
+        """
+        if self._ranging_signal is None:
+            self._ranging_signal = self._build_ranging_signal()
+        return self._ranging_signal
+    
+    def _build_ranging_signal(self):
+        """
+        构造测距信号
+        
         Returns:
-            numpy.ndarray: 测距信号
+            numpy.ndarray: 测距信号（只读）
         """
         # 前后添加静音段
-        silence_before = np.zeros(int(self.sample_rate * 0.05))  # 50ms静音
-        silence_after = np.zeros(int(self.sample_rate * 0.3))    # 300ms等待响应
+        n_before = int(self.sample_rate * 0.05)  # 50ms静音
+        n_after = int(self.sample_rate * 0.3)    # 300ms等待响应
+        
+        # 直接在单精度数组中放入Chirp
+        ranging_signal = np.zeros(n_before + len(self.reference_chirp) + n_after,
+                                  dtype=np.float32)
+        ranging_signal[n_before:n_before + len(self.reference_chirp)] = self.reference_chirp
+        
+        # 多处共享同一个数组，禁止修改
+        ranging_signal.flags.writeable = False
+        return ranging_signal
+    
+    def _get_ref_fft(self, nfft):
+        """
+        获取（必要时计算并缓存）反转参考Chirp的频谱
+        
+        Args:
+            nfft: FFT长度
+            
+        Returns:
+            numpy.ndarray: 单精度频谱
+        """
+        ref_fft = self._ref_fft_cache.get(nfft)
+        if ref_fft is None:
+            ref_fft = rfft(self.reference_chirp[::-1], n=nfft)
+            self._ref_fft_cache[nfft] = ref_fft
+        return ref_fft
+    
+    def _get_ref_fft_gpu(self, nfft):
+        """
+        获取（必要时上传并缓存）显存中的参考Chirp频谱
+        
+        Args:
+            nfft: FFT长度
+            
+        Returns:
+            cupy.ndarray: 单精度频谱
+        """
+        ref_fft = self._ref_fft_gpu_cache.get(nfft)
+        if ref_fft is None:
+            ref_fft = cp.asarray(self._get_ref_fft(nfft))
+            self._ref_fft_gpu_cache[nfft] = ref_fft
+        return ref_fft
+    
+    def prepare(self, n):
+        """
+        为长度为 n 的录音预先计算匹配滤波器频谱
         
-        # 组合信号
-        ranging_signal = np.concatenate([
-            silence_before,
-            self.reference_chirp,
-            silence_after
-        ])
+        在初始化阶段调用，之后 detect_chirp 处理该长度的录音时直接使用缓存，
+        第一次测距不再需要计算参考频谱；安装了numba时同时完成检测内核的编译
         
-        return ranging_signal.astype(np.float32)
+        Args:
+            n: 录音长度（采样点）
+        """
+        if n >= len(self.reference_chirp):
+            nfft = next_fast_len(n, real=True)
+            self._get_ref_fft(nfft)
+            if HAS_GPU and n >= self.GPU_MIN_SAMPLES:
+                self._get_ref_fft_gpu(nfft)
+            
+        if HAS_NUMBA:
+            # 触发JIT编译（或加载缓存），第一次检测不再等待编译
+            _abs_max_inplace(np.zeros(1, dtype=np.float32))
+            # 实际调用传入的是 argsort 结果的反转视图（非连续布局），用同样布局的数组预热
+            _greedy_peaks(np.zeros(2, dtype=np.int64)[::-1], 1, 1)
+    
+    def _matched_filter(self, x):
+        """
+        频域匹配滤波，等价于 signal.correlate(x, reference_chirp, mode='valid')
+        
+        参考Chirp的频谱按FFT长度缓存，每次只需对录音做一次正变换和一次逆变换
+        
+        Args:
+            x: 输入信号，一维或二维（每行一段信号，沿最后一维批量计算）
+            
+        Returns:
+            numpy.ndarray: 互相关结果，最后一维长度为 n - len(reference_chirp) + 1
+        """
+        m = len(self.reference_chirp)
+        n = x.shape[-1]
+        if n < m:
+            return np.zeros(x.shape[:-1] + (0,), dtype=np.float32)
+        
+        # 循环卷积长度不小于信号长度即可保证 valid 部分不受回绕影响；
+        # 取不小于 n 的 2/3/5 平滑数，通常比下一个2的幂小得多
+        nfft = next_fast_len(n, real=True)
+        if HAS_GPU and n >= self.GPU_MIN_SAMPLES:
+            return self._gpu_matched_filter(x, nfft)
+        ref_fft = self._get_ref_fft(nfft)
+            
+        # 频谱原地相乘，逆变换允许覆盖频谱数组，整个过程只分配频谱和结果两个数组
+        workers = self.FFT_WORKERS
+        spectrum = rfft(x, n=nfft, axis=-1, workers=workers)
+        spectrum *= ref_fft
+        corr = irfft(spectrum, n=nfft, axis=-1, workers=workers, overwrite_x=True)
+        return corr[..., m - 1:n]
+    
+    def _gpu_matched_filter(self, x, nfft):
+        """
+        在GPU上计算匹配滤波，结果与 _matched_filter 的CPU路径相同
+        
+        录音上传一次，正变换、频谱相乘、逆变换都在显存中完成，只把 valid 部分传回
+        
+        Args:
+            x: 输入信号（float32，一维或二维）
+            nfft: FFT长度
+            
+        Returns:
+            numpy.ndarray: 互相关结果
+        """
+        m = len(self.reference_chirp)
+        n = x.shape[-1]
+        spectrum = cp.fft.rfft(cp.asarray(x, dtype=cp.float32), n=nfft, axis=-1)
+        spectrum *= self._get_ref_fft_gpu(nfft)
+        corr = cp.fft.irfft(spectrum, n=nfft, axis=-1)
+        return cp.asnumpy(corr[..., m - 1:n])
     
     def detect_chirp(self, recorded_signal, threshold_ratio=0.08, expected_peaks=2):
         """
@@ -96,61 +345,111 @@ class SignalProcessor:
         # 确保信号是一维的
         if len(recorded_signal.shape) > 1:
             recorded_signal = recorded_signal[:, 0]
+        # 全程使用单精度、连续内存（取多声道的一列时也在这里一次性拷贝），减少一半内存带宽
+        recorded_signal = np.ascontiguousarray(recorded_signal, dtype=np.float32)
         
-        # 带通滤波，只保留Chirp频率范围
-        nyquist = self.sample_rate / 2
-        low = (self.chirp_f0 - 1000) / nyquist
-        high = min((self.chirp_f1 + 1000) / nyquist, 0.99)
+        # 带通滤波，只保留Chirp频率范围（单向滤波，时延在最后统一扣除）
+        filtered_signal = self._bandpass(recorded_signal)
         
-        b, a = signal.butter(4, [low, high], btype='band')
-        filtered_signal = signal.filtfilt(b, a, recorded_signal)
+        # 计算互相关（频域匹配滤波）
+        correlation = self._matched_filter(filtered_signal)
+        return self._pick_peaks(correlation, threshold_ratio, expected_peaks)
+    
+    def detect_chirp_batch(self, recordings, threshold_ratio=0.08, expected_peaks=2):
+        """
+        批量检测多段录音中的Chirp信号位置
         
-        # 计算互相关
-        correlation = signal.correlate(filtered_signal, self.reference_chirp, mode='valid')
-        correlation = np.abs(correlation)
+        所有录音滤波后堆叠为一个二维数组，匹配滤波只做一次批量正变换和逆变换，
+        每段录音的结果与单独调用 detect_chirp 相同
         
-        # 归一化
-        max_corr = np.max(correlation)
-        if max_corr > 0:
-            correlation_norm = correlation / max_corr
+        Args:
+            recordings: 录音列表
+            threshold_ratio: 峰值检测阈值比例
+            expected_peaks: 期望检测到的峰值数量
+            
+        Returns:
+            list: 每段录音的 (检测位置列表, 互相关结果)
+        """
+        if not recordings:
+            return []
+            
+        signals = []
+        for recorded_signal in recordings:
+            recorded_signal = np.asarray(recorded_signal)
+            if recorded_signal.ndim > 1:
+                recorded_signal = recorded_signal[:, 0]
+            signals.append(np.ascontiguousarray(recorded_signal, dtype=np.float32))
+            
+        # 较短的录音末尾补零，不影响其有效互相关部分
+        batch = np.zeros((len(signals), max(len(x) for x in signals)), dtype=np.float32)
+        for row, x in zip(batch, signals):
+            row[:len(x)] = self._bandpass(x)
+            
+        correlations = self._matched_filter(batch)
+        m = len(self.reference_chirp)
+        return [self._pick_peaks(corr[:max(len(x) - m + 1, 0)], threshold_ratio, expected_peaks)
+                for corr, x in zip(correlations, signals)]
+    
+    def _pick_peaks(self, correlation, threshold_ratio, expected_peaks):
+        """
+        在互相关结果中选取Chirp峰值位置
+        
+        Args:
+            correlation: 互相关结果，会被原地取绝对值
+            threshold_ratio: 峰值检测阈值比例
+            expected_peaks: 期望检测到的峰值数量
+            
+        Returns:
+            tuple: (检测位置列表, 互相关结果)
+        """
+        if HAS_NUMBA:
+            # 取绝对值与求最大值合并为一次遍历
+            max_corr = _abs_max_inplace(correlation)
         else:
+            np.abs(correlation, out=correlation)
+            max_corr = np.max(correlation)
+        
+        # 不生成归一化副本，改为按最大值缩放检测阈值（峰高、显著性都与幅度成正比，结果等价）
+        if max_corr <= 0:
             return [], correlation
         
         # 检测峰值 - 使用更宽松的条件
         # 最小间隔：根据录音时长动态调整，至少15ms，避免漏掉对方较弱的峰
         min_distance = int(self.sample_rate * 0.015)
         
+        # 只用宽松条件检测一次，严格条件的结果是其子集，直接按峰值属性筛选
+        # （distance 在 prominence 之前生效，低于严格阈值的峰不会挤掉更高的峰，两者等价）
         peaks, properties = signal.find_peaks(
-            correlation_norm, 
-            height=threshold_ratio,
+            correlation, 
+            height=threshold_ratio * 0.5 * max_corr,
             distance=min_distance,
-            prominence=0.1  # 添加显著性要求，过滤噪声峰值
+            prominence=0.05 * max_corr
         )
         
-        # 如果检测到的峰值数量不足，尝试降低阈值重新检测
-        if len(peaks) < expected_peaks:
-            peaks, properties = signal.find_peaks(
-                correlation_norm, 
-                height=threshold_ratio * 0.5,
-                distance=min_distance,
-                prominence=0.05
-            )
+        # 严格条件：添加显著性要求，过滤噪声峰值；数量不足时使用宽松条件的结果
+        strict = ((properties['peak_heights'] >= threshold_ratio * max_corr) &
+                  (properties['prominences'] >= 0.1 * max_corr))
+        if np.count_nonzero(strict) >= expected_peaks:
+            peaks = peaks[strict]
 
         # 仍不足时，兜底选取互相关值最高的点，保证至少返回 expected_peaks 个位置
         if len(peaks) < expected_peaks:
-            sorted_idx = np.argsort(correlation_norm)[::-1]
-            fallback = []
-            for idx in sorted_idx:
-                if all(abs(idx - s) >= min_distance for s in fallback):
-                    fallback.append(idx)
-                if len(fallback) >= expected_peaks:
-                    break
-            if fallback:
+            sorted_idx = np.argsort(correlation)[::-1]
+            if HAS_NUMBA:
+                fallback = _greedy_peaks(sorted_idx, min_distance, expected_peaks)
+            else:
+                fallback = []
+                for idx in sorted_idx:
+                    if all(abs(idx - s) >= min_distance for s in fallback):
+                        fallback.append(idx)
+                    if len(fallback) >= expected_peaks:
+                        break
+            if len(fallback):
                 peaks = np.array(fallback, dtype=int)
 
         # 返回所有检测到的峰值，由上层逻辑决定如何筛选
-        # 排序以确保时间顺序
-        peaks = np.sort(peaks)
+        # 扣除滤波时延，并排序以确保时间顺序
+        peaks = np.sort(np.maximum(peaks - self._filter_delay, 0))
         
         return peaks.tolist(), correlation
     
@@ -176,12 +475,13 @@ class SignalProcessor:
         if d_bb is None:
             d_bb = self.d_self
             
-        # 将采样点转换为时间（秒）
-        delta_a = (t_a3 - t_a1) / self.sample_rate
-        delta_b = (t_b3 - t_b1) / self.sample_rate
+        # 采样点差值先按整数精确相减，再用 Python 双精度换算为时间（秒），
+        # 不受检测结果可能携带的单精度类型影响
+        delta_samples = (int(t_a3) - int(t_a1)) - (int(t_b3) - int(t_b1))
+        delta = delta_samples / self.sample_rate
         
         # 计算距离
-        distance = (self.speed_of_sound / 2) * (delta_a - delta_b) + (d_aa + d_bb) / 2
+        distance = (self.speed_of_sound / 2) * delta + (d_aa + d_bb) / 2
         
         return max(0, distance)  # 距离不能为负
     
@@ -195,7 +495,7 @@ class SignalProcessor:
         Returns:
             float: 距离（米）
         """
-        time_diff = time_diff_samples / self.sample_rate
+        time_diff = int(time_diff_samples) / self.sample_rate
         distance = self.speed_of_sound * time_diff
         return max(0, distance)
     
@@ -316,12 +616,15 @@ class RangingSession:
         if not distances:
             return None
             
+        # 只转换一次数组，各统计量直接在同一个数组上计算
+        values = np.array(distances, dtype=np.float64)
+        mean = values.mean()
         return {
             'count': len(distances),
-            'mean': np.mean(distances),
-            'std': np.std(distances),
-            'min': np.min(distances),
-            'max': np.max(distances),
+            'mean': mean,
+            'std': np.sqrt(np.mean(np.square(values - mean))),
+            'min': values.min(),
+            'max': values.max(),
             'measurements': distances
         }
 
@@ -16,20 +16,93 @@ plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode M
 plt.rcParams['axes.unicode_minus'] = False
 
 
+def _mean_std(arr):
+    """
+    一次遍历同时求均值和（总体）标准差
+    
+    Args:
+        arr: 数值数组
+        
+    Returns:
+        tuple: (mean, std)
+    """
+    arr = np.asarray(arr, dtype=float).ravel()
+    n = arr.size
+    mean = arr.sum() / n
+    # E[x²] - E[x]² 可能因舍入出现极小的负数
+    var = max(np.dot(arr, arr) / n - mean * mean, 0.0)
+    return mean, np.sqrt(var)
+
+
 class DataAnalyzer:
     """数据分析器"""
     
-    def __init__(self, output_dir='results'):
+    # FPS曲线超过该点数时抽稀绘制
+    FPS_PLOT_MAX_POINTS = 2000
+    # 抽稀时只为最后这些点绘制标记
+    FPS_PLOT_MARKER_TAIL = 500
+    
+    def __init__(self, output_dir='results', dpi=None, tight=None):
         """
         初始化分析器
         
         Args:
             output_dir: 输出目录
+            dpi: 保存图片的分辨率，None 时交互模式用150、批量模式用100
+            tight: 保存时是否裁剪空白（bbox_inches='tight'，需要额外渲染一次），
+                   None 时仅交互模式裁剪
         """
         self.output_dir = output_dir
+        self.dpi = dpi
+        self.tight = tight
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             
+        # 可复用的图表 {key: (fig, ax)}
+        self._figures = {}
+        # 批量生成时只保存图片，不弹出窗口
+        self._batch = False
+            
+    def _save_figure(self, fig, save_path):
+        """
+        按当前模式保存图表
+        
+        Args:
+            fig: 要保存的图表
+            save_path: 保存路径
+        """
+        dpi = self.dpi if self.dpi is not None else (100 if self._batch else 150)
+        tight = self.tight if self.tight is not None else not self._batch
+        fig.savefig(save_path, dpi=dpi, bbox_inches='tight' if tight else None)
+        print(f"图表已保存: {save_path}")
+        
+    def _close_cached_figures(self):
+        """关闭并清空所有可复用的图表"""
+        for fig, _ in self._figures.values():
+            plt.close(fig)
+        self._figures.clear()
+        
+    def _get_or_create_fig(self, key, figsize):
+        """
+        获取可复用的图表，不存在或窗口已关闭时重新创建
+        
+        Args:
+            key: 图表标识
+            figsize: 图表尺寸
+            
+        Returns:
+            tuple: (fig, ax)
+        """
+        cached = self._figures.get(key)
+        if cached is not None and plt.fignum_exists(cached[0].number):
+            fig, ax = cached
+            ax.cla()
+            return fig, ax
+            
+        fig, ax = plt.subplots(figsize=figsize)
+        self._figures[key] = (fig, ax)
+        return fig, ax
+            
     def load_data(self, filepath):
         """
         加载CSV数据文件
@@ -40,7 +113,12 @@ class DataAnalyzer:
         Returns:
             DataFrame: 数据
         """
-        return pd.read_csv(filepath, encoding='utf-8')
+        try:
+            # 优先使用pyarrow的多线程CSV解析器
+            return pd.read_csv(filepath, encoding='utf-8', engine='pyarrow')
+        except (ImportError, ValueError):
+            # 未安装pyarrow或pandas版本过旧时使用默认的C解析器
+            return pd.read_csv(filepath, encoding='utf-8')
     
     def calculate_statistics(self, data, measured_col='测量距离', actual_col='实际距离'):
         """
@@ -54,19 +132,23 @@ class DataAnalyzer:
         Returns:
             dict: 统计结果
         """
+        # 只取一次列数据，之后全部在NumPy数组上计算
+        measured = data[measured_col].to_numpy(dtype=float)
+        
+        error_mean = error_std = None
         if actual_col in data.columns:
-            errors = np.abs(data[measured_col] - data[actual_col])
-        else:
-            errors = data[measured_col]
+            errors = np.abs(measured - data[actual_col].to_numpy(dtype=float))
+            error_mean = errors.mean()
+            error_std = errors.std()
             
         return {
             'count': len(data),
-            'mean': np.mean(data[measured_col]),
-            'std': np.std(data[measured_col]),
-            'min': np.min(data[measured_col]),
-            'max': np.max(data[measured_col]),
-            'error_mean': np.mean(errors) if actual_col in data.columns else None,
-            'error_std': np.std(errors) if actual_col in data.columns else None
+            'mean': measured.mean(),
+            'std': measured.std(),
+            'min': measured.min(),
+            'max': measured.max(),
+            'error_mean': error_mean,
+            'error_std': error_std
         }
     
     def plot_error_histogram(self, data, actual_distance, title='测距误差分布', 
@@ -88,13 +170,13 @@ class DataAnalyzer:
             
         errors = measurements - actual_distance
         
-        fig, ax = plt.subplots(figsize=(10, 6))
+        # 多个直方图复用同一个图表，省去每次创建Figure的开销
+        fig, ax = self._get_or_create_fig('hist', (10, 6))
         
         n, bins, patches = ax.hist(errors, bins=20, edgecolor='black', alpha=0.7)
         
         # 添加统计信息
-        mean_error = np.mean(errors)
-        std_error = np.std(errors)
+        mean_error, std_error = _mean_std(errors)
         
         ax.axvline(mean_error, color='red', linestyle='--', linewidth=2, 
                   label=f'均值: {mean_error:.4f}m')
@@ -109,13 +191,13 @@ class DataAnalyzer:
         ax.legend()
         ax.grid(True, alpha=0.3)
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"图表已保存: {save_path}")
+            self._save_figure(fig, save_path)
             
-        plt.show()
+        if not self._batch:
+            plt.show()
         
     def plot_distance_comparison(self, results_dict, title='不同距离下的测距误差', save_path=None):
         """
@@ -127,14 +209,18 @@ class DataAnalyzer:
             save_path: 保存路径
         """
         distances = sorted(results_dict.keys())
-        means = []
-        stds = []
-        
-        for d in distances:
-            measurements = np.array(results_dict[d])
-            errors = np.abs(measurements - d)
-            means.append(np.mean(errors))
-            stds.append(np.std(errors))
+        
+        # 所有距离的测量值拼接为一个数组，按距离编号分组，一次 bincount 得到各组的和
+        groups = [np.asarray(results_dict[d], dtype=float).ravel() for d in distances]
+        counts = np.array([len(g) for g in groups])
+        bins = np.repeat(np.arange(len(distances)), counts)
+        errors = np.abs(np.concatenate(groups) - np.repeat(np.asarray(distances, dtype=float), counts))
+        
+        n = np.bincount(bins, minlength=len(distances))
+        means = np.bincount(bins, weights=errors, minlength=len(distances)) / n
+        mean_sq = np.bincount(bins, weights=errors * errors, minlength=len(distances)) / n
+        # E[x²] - E[x]² 可能因舍入出现极小的负数
+        stds = np.sqrt(np.maximum(mean_sq - means * means, 0.0))
             
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
         
@@ -169,10 +255,13 @@ class DataAnalyzer:
         plt.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"图表已保存: {save_path}")
+            self._save_figure(fig, save_path)
             
-        plt.show()
+        if not self._batch:
+            plt.show()
+        else:
+            # 批量模式下保存后立即释放，避免图表随数量累积占用内存
+            plt.close(fig)
         
     def plot_noise_comparison(self, results_dict, actual_distance=3.0, 
                              title='不同噪声环境下的测距误差', save_path=None):
@@ -186,14 +275,13 @@ class DataAnalyzer:
             save_path: 保存路径
         """
         environments = list(results_dict.keys())
-        means = []
-        stds = []
+        means = np.empty(len(environments))
+        stds = np.empty(len(environments))
         
-        for env in environments:
-            measurements = np.array(results_dict[env])
+        for i, env in enumerate(environments):
+            measurements = np.asarray(results_dict[env], dtype=float)
             errors = np.abs(measurements - actual_distance)
-            means.append(np.mean(errors))
-            stds.append(np.std(errors))
+            means[i], stds[i] = _mean_std(errors)
             
         fig, ax = plt.subplots(figsize=(10, 6))
         
@@ -222,10 +310,13 @@ class DataAnalyzer:
         plt.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"图表已保存: {save_path}")
+            self._save_figure(fig, save_path)
             
-        plt.show()
+        if not self._batch:
+            plt.show()
+        else:
+            # 批量模式下保存后立即释放，避免图表随数量累积占用内存
+            plt.close(fig)
         
     def plot_occlusion_comparison(self, results_dict, actual_distance=3.0,
                                   title='不同遮挡条件下的测距误差', save_path=None):
@@ -257,9 +348,21 @@ class DataAnalyzer:
             
         fig, ax = plt.subplots(figsize=(12, 5))
         
-        ax.plot(fps_values, marker='o', markersize=3, linewidth=1, alpha=0.7)
-        ax.axhline(np.mean(fps_values), color='red', linestyle='--', 
-                  label=f'平均FPS: {np.mean(fps_values):.1f}')
+        n = fps_values.size
+        if n <= self.FPS_PLOT_MAX_POINTS:
+            ax.plot(fps_values, marker='o', markersize=3, linewidth=1, alpha=0.7)
+        else:
+            # 长序列：抽稀后栅格化绘制折线，只给最后一段加标记
+            stride = n // self.FPS_PLOT_MAX_POINTS
+            ax.plot(np.arange(0, n, stride), fps_values[::stride],
+                    linewidth=1, alpha=0.7, rasterized=True)
+            tail = n - self.FPS_PLOT_MARKER_TAIL
+            ax.plot(np.arange(tail, n), fps_values[tail:], marker='o', markersize=3,
+                    linestyle='none', color='C0', alpha=0.7)
+        
+        mean_fps = np.mean(fps_values)
+        ax.axhline(mean_fps, color='red', linestyle='--', 
+                  label=f'平均FPS: {mean_fps:.1f}')
         ax.axhline(1, color='green', linestyle=':', label='最低要求: 1 FPS')
         ax.axhline(20, color='orange', linestyle=':', label='满分标准: 20 FPS')
         
@@ -272,10 +375,13 @@ class DataAnalyzer:
         plt.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"图表已保存: {save_path}")
+            self._save_figure(fig, save_path)
             
-        plt.show()
+        if not self._batch:
+            plt.show()
+        else:
+            # 批量模式下保存后立即释放，避免图表随数量累积占用内存
+            plt.close(fig)
         
     def generate_summary_table(self, all_results, output_file='summary.csv'):
         """
@@ -288,28 +394,46 @@ class DataAnalyzer:
         Returns:
             DataFrame: 汇总表格
         """
-        rows = []
-        
+        # 展开为长表：每个测量值一行，带上所属的实验、条件和实际距离
+        experiments, conditions, actuals, lengths = [], [], [], []
+        values = []
         for experiment, results in all_results.items():
             for condition, data in results.items():
-                measurements = np.array(data['measurements'])
+                measurements = np.asarray(data['measurements'], dtype=float)
                 actual = data.get('actual_distance', 0)
-                errors = np.abs(measurements - actual) if actual else measurements
+                experiments.append(experiment)
+                conditions.append(condition)
+                actuals.append(actual)
+                lengths.append(len(measurements))
+                values.append(measurements)
                 
-                rows.append({
-                    '实验': experiment,
-                    '条件': condition,
-                    '实际距离(m)': actual,
-                    '测量次数': len(measurements),
-                    '测量均值(m)': np.mean(measurements),
-                    '测量标准差(m)': np.std(measurements),
-                    '误差均值(m)': np.mean(errors),
-                    '误差标准差(m)': np.std(errors),
-                    '最小误差(m)': np.min(errors),
-                    '最大误差(m)': np.max(errors)
-                })
-                
-        df = pd.DataFrame(rows)
+        flat = pd.DataFrame({
+            '实验': np.repeat(experiments, lengths),
+            '条件': np.repeat(conditions, lengths),
+            'actual': np.repeat(actuals, lengths),
+            'm': np.concatenate(values or [np.empty(0)])
+        })
+        # 有实际距离时误差为绝对偏差，否则直接用测量值
+        measured_values = flat['m'].to_numpy()
+        actual_values = np.nan_to_num(flat['actual'].to_numpy(dtype=float))
+        flat['err'] = np.where(actual_values != 0,
+                               np.abs(measured_values - actual_values),
+                               measured_values)
+        
+        # 按实验和条件分组，一次完成所有统计（保持原来的出现顺序；标准差与np.std一致，ddof=0）
+        grouped = flat.groupby(['实验', '条件'], sort=False)
+        measured = grouped['m']
+        error = grouped['err']
+        df = pd.DataFrame({
+            '实际距离(m)': grouped['actual'].first(),
+            '测量次数': measured.size(),
+            '测量均值(m)': measured.mean(),
+            '测量标准差(m)': measured.std(ddof=0),
+            '误差均值(m)': error.mean(),
+            '误差标准差(m)': error.std(ddof=0),
+            '最小误差(m)': error.min(),
+            '最大误差(m)': error.max()
+        }).reset_index()
         
         output_path = os.path.join(self.output_dir, output_file)
         df.to_csv(output_path, index=False, encoding='utf-8-sig')
@@ -318,7 +442,7 @@ class DataAnalyzer:
         return df
     
     def generate_report_figures(self, distance_results, noise_results, 
-                               occlusion_results, fps_data):
+                               occlusion_results, fps_data, batch=False):
         """
         生成实验报告所需的所有图表
         
@@ -327,7 +451,27 @@ class DataAnalyzer:
             noise_results: 噪声实验结果
             occlusion_results: 遮挡实验结果
             fps_data: FPS数据
+            batch: 批量模式，使用非交互的Agg后端只保存图片，不显示窗口
         """
+        if not batch:
+            self._generate_report_figures(distance_results, noise_results,
+                                          occlusion_results, fps_data)
+            return
+            
+        previous_backend = plt.get_backend()
+        plt.switch_backend('Agg')
+        self._batch = True
+        try:
+            self._generate_report_figures(distance_results, noise_results,
+                                          occlusion_results, fps_data)
+        finally:
+            self._batch = False
+            self._close_cached_figures()
+            plt.switch_backend(previous_backend)
+            
+    def _generate_report_figures(self, distance_results, noise_results,
+                                 occlusion_results, fps_data):
+        """生成所有报告图表（参数同 generate_report_figures）"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         # 1. 距离实验
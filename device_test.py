@@ -10,6 +10,81 @@ import matplotlib.pyplot as plt
 from scipy import signal as sig
 import time
 
+from core.jit import njit, HAS_NUMBA
+
+# 时间轴缓存 {(sample_rate, duration): t}
+_T_CACHE = {}
+
+
+def _time_axis(sample_rate, duration):
+    """
+    获取 float32 时间轴（按采样率和时长缓存，只生成一次）
+    
+    Args:
+        sample_rate: 采样率
+        duration: 时长（秒）
+        
+    Returns:
+        np.ndarray: 只读的时间轴
+    """
+    key = (sample_rate, duration)
+    t = _T_CACHE.get(key)
+    if t is None:
+        t = np.arange(int(sample_rate * duration), dtype=np.float32) * np.float32(1.0 / sample_rate)
+        t.flags.writeable = False
+        _T_CACHE[key] = t
+    return t
+
+
+def _welch_psd(x, sample_rate, nperseg=4096):
+    """
+    功率谱密度估计，与 sig.welch 默认参数（Hann窗、50%重叠、去均值、密度谱）一致，
+    所有分段堆叠后一次批量 rfft 完成
+    
+    Args:
+        x: 一维信号（float32）
+        sample_rate: 采样率
+        nperseg: 每段长度
+        
+    Returns:
+        tuple: (freqs, psd)
+    """
+    window = sig.get_window('hann', nperseg).astype(np.float32)
+    segments = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::nperseg // 2]
+    segments = segments - segments.mean(axis=1, keepdims=True)
+    segments *= window
+    
+    spectrum = np.fft.rfft(segments, axis=1)
+    psd = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=0)
+    psd /= sample_rate * np.dot(window, window)
+    # 单边谱：除直流和奈奎斯特外能量加倍
+    psd[1:-1] *= 2
+    
+    freqs = np.fft.rfftfreq(nperseg, 1.0 / sample_rate)
+    return freqs, psd
+
+
+@njit(cache=True, fastmath=True)
+def _peak_stats(corr):
+    """
+    原地取绝对值并找出峰值位置和峰值（一次遍历，供numba编译）
+    
+    Args:
+        corr: 一维相关结果，会被原地修改为绝对值
+        
+    Returns:
+        tuple: (峰值位置, 峰值)
+    """
+    peak = 0.0
+    peak_idx = 0
+    for i in range(corr.shape[0]):
+        v = abs(corr[i])
+        corr[i] = v
+        if v > peak:
+            peak = v
+            peak_idx = i
+    return peak_idx, peak
+
 
 def test_speaker_frequency_response():
     """测试扬声器频率响应"""
@@ -27,10 +102,13 @@ def test_speaker_frequency_response():
     print("   请仔细听，记录每个频率是否能清晰听到")
     print("-" * 50)
     
+    # 时间轴和 2πt 与频率无关，循环外只算一次
+    t = _time_axis(sample_rate, duration)
+    phase = (2 * np.pi * t).astype(np.float32)
+    
     for freq in test_frequencies:
         # 生成正弦波
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
-        tone = 0.3 * np.sin(2 * np.pi * freq * t)
+        tone = 0.3 * np.sin(freq * phase, dtype=np.float32)
         
         print(f"   播放 {freq:5d} Hz...", end=" ", flush=True)
         sd.play(tone, sample_rate)
@@ -56,7 +134,7 @@ def test_record_frequency_response():
     duration = 1.0
     
     # 生成扫频信号 (Chirp)
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    t = _time_axis(sample_rate, duration)
     
     # 测试两个频率范围
     test_ranges = [
@@ -77,10 +155,10 @@ def test_record_frequency_response():
         print("   播放并录制中...")
         recorded = sd.playrec(chirp, sample_rate, channels=1)
         sd.wait()
-        recorded = recorded.flatten()
+        recorded = np.ascontiguousarray(recorded.ravel(), dtype=np.float32)
         
         # 分析录制信号的频谱
-        freqs, psd = sig.welch(recorded, sample_rate, nperseg=4096)
+        freqs, psd = _welch_psd(recorded, sample_rate, nperseg=4096)
         
         # 计算目标频率范围内的能量
         mask = (freqs >= f0) & (freqs <= f1)
@@ -126,39 +204,47 @@ def test_chirp_detection():
         ("超声波范围 17-20kHz", 17000, 20000),
     ]
     
+    n_chirp = int(sample_rate * chirp_duration)
+    offset = int(sample_rate * 0.1)  # 100ms 静音
+    total_len = offset + n_chirp + int(sample_rate * (record_duration - 0.1 - chirp_duration))
+    
     for name, f0, f1 in test_ranges:
         print(f"\n   测试: {name}")
         
         # 生成 Chirp 信号
-        t = np.linspace(0, chirp_duration, int(sample_rate * chirp_duration), False)
-        chirp = sig.chirp(t, f0, chirp_duration, f1, method='linear')
-        chirp = 0.5 * chirp.astype(np.float32)
+        t = _time_axis(sample_rate, chirp_duration)
+        chirp = sig.chirp(t, f0, chirp_duration, f1, method='linear').astype(np.float32)
+        chirp *= 0.5
         
-        # 创建带静音的信号
-        silence_before = np.zeros(int(sample_rate * 0.1))  # 100ms 静音
-        silence_after = np.zeros(int(sample_rate * (record_duration - 0.1 - chirp_duration)))
-        full_signal = np.concatenate([silence_before, chirp, silence_after])
+        # 创建带静音的信号：前100ms静音，Chirp直接写入预分配的缓冲区
+        full_signal = np.zeros(total_len, dtype=np.float32)
+        full_signal[offset:offset + n_chirp] = chirp
         
         # 播放并录制
         print("   播放并录制中...")
         recorded = sd.playrec(full_signal, sample_rate, channels=1)
         sd.wait()
-        recorded = recorded.flatten()
+        recorded = np.ascontiguousarray(recorded.ravel(), dtype=np.float32)
         
         # 带通滤波
         nyquist = sample_rate / 2
         low = max((f0 - 1000) / nyquist, 0.01)
         high = min((f1 + 1000) / nyquist, 0.99)
-        b, a = sig.butter(4, [low, high], btype='band')
-        filtered = sig.filtfilt(b, a, recorded)
+        # 单向SOS滤波即可：峰值靠相关包络定位，不需要零相位
+        sos = sig.butter(4, [low, high], btype='band', output='sos').astype(np.float32)
+        filtered = sig.sosfilt(sos, recorded)
         
         # 互相关检测
-        correlation = sig.correlate(filtered, chirp, mode='valid')
-        correlation = np.abs(correlation)
+        correlation = sig.correlate(filtered, chirp, mode='valid', method='fft')
         
         # 检测峰值
-        peak_idx = np.argmax(correlation)
-        peak_value = correlation[peak_idx]
+        if HAS_NUMBA:
+            # 取绝对值与找峰值合并为一次遍历
+            peak_idx, peak_value = _peak_stats(correlation)
+        else:
+            np.abs(correlation, out=correlation)
+            peak_idx = np.argmax(correlation)
+            peak_value = correlation[peak_idx]
         noise_level = np.median(correlation)
         snr = peak_value / (noise_level + 1e-10)
         
@@ -12,9 +12,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
+import queue
 import time
+import math
 import numpy as np
-from datetime import datetime
 import matplotlib
 matplotlib.use('TkAgg')
 from matplotlib.figure import Figure
@@ -22,11 +23,44 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 from core.signal_processor import SignalProcessor
 from core.audio_io import AudioIO
+from core.fft import rfft
+from core.priority import boost_thread
+from core.log import clock_str
+
+
+def _envelope(t, x, max_points=4000):
+    """
+    把长信号抽取为最小/最大值包络，用于绘图
+    
+    每 k 个采样点保留最小值和最大值，折线外观与原信号一致，线段数大幅减少
+    
+    Args:
+        t: 时间轴
+        x: 信号
+        max_points: 包络的最大分段数
+        
+    Returns:
+        tuple: (时间轴, 包络)
+    """
+    k = len(x) // max_points
+    if k < 2:
+        return t, x
+    n = len(x) // k * k
+    xr = np.asarray(x[:n]).reshape(-1, k)
+    env = np.stack([xr.min(axis=1), xr.max(axis=1)], axis=-1).ravel()
+    return np.repeat(t[:n:k], 2), env
 
 
 class StandaloneTestApp:
     """单机测试应用"""
     
+    # 连续测距时每批一起检测的录音数（设为1则每次测量后立即显示）
+    CONTINUOUS_BATCH_SIZE = 4
+    # 录音线程与检测线程之间最多排队的录音数
+    CONTINUOUS_QUEUE_SIZE = 2
+    # 图表最短重绘间隔（秒）
+    DRAW_INTERVAL = 0.1
+    
     def __init__(self, root):
         self.root = root
         self.root.title("声波测距 - 单机测试")
@@ -36,12 +70,36 @@ class StandaloneTestApp:
         self.signal_processor = SignalProcessor()
         self.audio = AudioIO()
         
-        # 测量数据
-        self.measurements = []
+        # 测距信号固定不变，取一次后各处复用；同时为两种录音长度预先计算匹配滤波器频谱
+        self._ranging_signal = self.signal_processor.generate_ranging_signal()
+        sample_rate = self.signal_processor.sample_rate
+        for extra_duration in (0.5, 1.0):
+            n = int((len(self._ranging_signal) / sample_rate + extra_duration) * sample_rate)
+            self.signal_processor.prepare(n)
+        
+        # 绘图用频率轴缓存（信号长度 -> kHz频率轴），Chirp频谱固定只算一次
+        self._freq_axes = {}
+        # 绘图用时间轴缓存 {(信号长度, 单位倍数): 时间轴}
+        self._t_cache = {}
+        self._chirp_spectrum = None
+        
+        # 测量统计：累计测量次数，以及全部测量值的均值和二阶中心矩，
+        # 逐次增量更新（Welford算法），不保存各次测量值
+        self._n = 0
+        self._stat_mean = 0.0
+        self._stat_m2 = 0.0
         self.is_continuous = False
         
         self._create_ui()
         
+        # 预先打开常开的音频流，之后的录音和播放都复用它
+        try:
+            self.audio.open_stream()
+        except Exception as e:
+            self.log(f"音频流启动失败: {e}")
+            
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
     def _create_ui(self):
         """创建UI"""
         # 使用Notebook创建标签页
@@ -87,9 +145,12 @@ class StandaloneTestApp:
         self.continuous_btn.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(continuous_frame, text="间隔(秒):").pack(side=tk.LEFT)
-        self.interval_entry = ttk.Entry(continuous_frame, width=5)
+        # 间隔只在输入变化时解析一次，连续测距线程直接读取 self._interval
+        self._interval = 0.5
+        self.interval_var = tk.DoubleVar(value=self._interval)
+        self.interval_var.trace_add('write', self._on_interval_changed)
+        self.interval_entry = ttk.Entry(continuous_frame, width=5, textvariable=self.interval_var)
         self.interval_entry.pack(side=tk.LEFT, padx=5)
-        self.interval_entry.insert(0, "0.5")
         
         # 结果显示
         result_frame = ttk.LabelFrame(parent, text="测距结果", padding="10")
@@ -131,6 +192,22 @@ class StandaloneTestApp:
         self.canvas = FigureCanvasTkAgg(self.fig, master=parent)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=10)
         
+        # 各视图的坐标轴和曲线只创建一次，之后只更新数据 {视图名: [(ax, line), ...]}
+        self._views = {}
+        self._grid = None
+        self._current_view = None
+        self._layout_pending = False
+        # 检测位置标记 {ax: [Line2D, ...]}
+        self._markers = {}
+        # 重绘节流
+        self._last_draw = 0.0
+        self._draw_scheduled = False
+        # 局部刷新：曲线和标记设为 animated，不进入整图渲染；坐标范围不变时
+        # 只恢复缓存的坐标轴背景、重画曲线并把该区域贴到Tk画布上
+        self._backgrounds = {}
+        self._full_redraw = True
+        self.canvas.mpl_connect('draw_event', self._on_draw_event)
+        
     def _create_device_tab(self, parent):
         """创建设备检测标签页"""
         # 设备列表
@@ -157,15 +234,14 @@ class StandaloneTestApp:
     def log(self, message):
         """添加日志"""
         self.log_text.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.log_text.insert(tk.END, f"[{clock_str()}] {message}\n")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
         
     def play_test_signal(self):
         """播放测试信号"""
         self.log("播放Chirp信号...")
-        signal = self.signal_processor.generate_ranging_signal()
+        signal = self._ranging_signal
         
         def play():
             self.audio.play_sound(signal, blocking=True)
@@ -178,6 +254,7 @@ class StandaloneTestApp:
         self.log("开始录音（2秒）...")
         
         def record():
+            boost_thread()
             recorded = self.audio.record_for_duration(2.0)
             self.root.after(0, lambda: self.log(f"录音完成，采样点数: {len(recorded)}"))
             
@@ -186,9 +263,10 @@ class StandaloneTestApp:
     def play_and_record(self):
         """播放并录音"""
         self.log("播放并录音...")
-        signal = self.signal_processor.generate_ranging_signal()
+        signal = self._ranging_signal
         
         def do_play_record():
+            boost_thread()
             recorded = self.audio.play_and_record(signal, extra_duration=0.5)
             
             # 检测Chirp
@@ -208,36 +286,28 @@ class StandaloneTestApp:
                 self.log(f"  Chirp {i+1}: 位置 {pos} ({time_ms:.1f}ms)")
                 
         # 更新图表
-        self.fig.clear()
-        
-        ax1 = self.fig.add_subplot(211)
-        t = np.arange(len(recorded)) / self.signal_processor.sample_rate * 1000
-        ax1.plot(t, recorded)
-        ax1.set_xlabel('时间 (ms)')
-        ax1.set_ylabel('幅度')
-        ax1.set_title('录制的信号')
+        (ax1, line1), (ax2, line2) = self._get_view('play_record', [
+            ('时间 (ms)', '幅度', '录制的信号'),
+            ('时间 (ms)', '相关值', '互相关结果'),
+        ])
         
         # 标记检测位置
-        for pos in detections:
-            time_ms = pos / self.signal_processor.sample_rate * 1000
-            ax1.axvline(time_ms, color='r', linestyle='--', alpha=0.7)
-            
-        ax2 = self.fig.add_subplot(212)
-        t_corr = np.arange(len(correlation)) / self.signal_processor.sample_rate * 1000
-        ax2.plot(t_corr, correlation)
-        ax2.set_xlabel('时间 (ms)')
-        ax2.set_ylabel('相关值')
-        ax2.set_title('互相关结果')
+        t = self._time_axis(len(recorded), 1000)
+        marks = np.asarray(detections) / self.signal_processor.sample_rate * 1000
+        self._set_line(ax1, line1, *_envelope(t, recorded), markers=marks)
+        
+        t_corr = self._time_axis(len(correlation), 1000)
+        self._set_line(ax2, line2, *_envelope(t_corr, correlation))
         
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self._request_draw()
         
     def single_ranging(self):
         """单次测距"""
         self.log("执行单次测距...")
         
         def do_ranging():
-            signal = self.signal_processor.generate_ranging_signal()
+            boost_thread()
+            signal = self._ranging_signal
             recorded = self.audio.play_and_record(signal, extra_duration=1.0)
             detections, _ = self.signal_processor.detect_chirp(recorded, threshold_ratio=0.2)
             
@@ -247,26 +317,47 @@ class StandaloneTestApp:
                 # 距离 = 声速 * 时间 / 2 (往返)
                 distance = self.signal_processor.speed_of_sound * time_diff / 2
                 
-                self.measurements.append(distance)
+                self._record_measurement(distance)
                 self.root.after(0, lambda: self._update_distance(distance))
             else:
                 self.root.after(0, lambda: self.log("未检测到足够的信号"))
                 
         threading.Thread(target=do_ranging, daemon=True).start()
         
+    def _record_measurement(self, distance):
+        """
+        记录一次测量结果
+        
+        Args:
+            distance: 距离（米）
+        """
+        self._n += 1
+        
+        # 增量更新统计量
+        delta = distance - self._stat_mean
+        self._stat_mean += delta / self._n
+        self._stat_m2 += delta * (distance - self._stat_mean)
+        
     def _update_distance(self, distance):
         """更新距离显示"""
         self.distance_label.config(text=f"{distance:.3f} m")
-        self.count_label.config(text=f"测量次数: {len(self.measurements)}")
+        self.count_label.config(text=f"测量次数: {self._n}")
         
-        if self.measurements:
-            mean = np.mean(self.measurements)
-            std = np.std(self.measurements)
+        if self._n:
+            mean = self._stat_mean
+            std = math.sqrt(self._stat_m2 / self._n)
             self.mean_label.config(text=f"均值: {mean:.3f} m")
             self.std_label.config(text=f"标准差: {std:.3f} m")
             
         self.log(f"测距结果: {distance:.3f} m")
         
+    def _on_interval_changed(self, *args):
+        """测距间隔输入变化，输入无效时保持原值"""
+        try:
+            self._interval = float(self.interval_var.get())
+        except (tk.TclError, ValueError):
+            pass
+            
     def toggle_continuous(self):
         """切换连续测距"""
         self.is_continuous = not self.is_continuous
@@ -275,58 +366,249 @@ class StandaloneTestApp:
             self.continuous_btn.config(text="停止连续测距")
             self.log("开始连续测距")
             
+            # 录音与检测流水线：录音线程只负责播放/录制，检测线程处理上一批录音，
+            # 每轮耗时约为两者中较大的一个，而不是两者之和
+            captured = queue.Queue(maxsize=self.CONTINUOUS_QUEUE_SIZE)
+            stop = threading.Event()
+            self._continuous_stop = stop
+            
+            # 每段录音写入自己的缓冲区，轮换使用。队列中的录音在被检测前归检测线程所有，
+            # 录音线程不能再写入，所以缓冲区数量要覆盖同时存活的全部录音：
+            # 攒批中的一批、队列中的录音和正在录制的一段
+            signal = self._ranging_signal
+            sample_rate = self.signal_processor.sample_rate
+            n = int((len(signal) / sample_rate + 0.5) * sample_rate)
+            bufs = [np.empty(n, dtype=np.float32)
+                    for _ in range(self.CONTINUOUS_BATCH_SIZE + self.CONTINUOUS_QUEUE_SIZE + 1)]
+            
+            def capture_loop():
+                boost_thread()
+                try:
+                    i = 0
+                    while not stop.is_set():
+                        out = bufs[i]
+                        i = (i + 1) % len(bufs)
+                        captured.put(self.audio.play_and_record(signal, extra_duration=0.5, out=out))
+                        stop.wait(self._interval)
+                finally:
+                    # 通知检测线程结束
+                    captured.put(None)
+                    
             def continuous_loop():
-                while self.is_continuous:
-                    try:
-                        interval = float(self.interval_entry.get())
-                    except:
-                        interval = 0.5
-                        
-                    signal = self.signal_processor.generate_ranging_signal()
-                    recorded = self.audio.play_and_record(signal, extra_duration=0.5)
-                    detections, _ = self.signal_processor.detect_chirp(recorded, threshold_ratio=0.2)
+                boost_thread()
+                pending = []
+                while True:
+                    recorded = captured.get()
+                    if recorded is None:
+                        break
+                    pending.append(recorded)
                     
-                    if len(detections) >= 2:
-                        time_diff = (detections[1] - detections[0]) / self.signal_processor.sample_rate
-                        distance = self.signal_processor.speed_of_sound * time_diff / 2
-                        self.measurements.append(distance)
-                        self.root.after(0, lambda d=distance: self._update_distance(d))
+                    # 攒够一批录音后一起检测，匹配滤波只做一次批量FFT
+                    if len(pending) >= self.CONTINUOUS_BATCH_SIZE:
+                        self._process_continuous_batch(pending)
+                        pending = []
                         
-                    time.sleep(interval)
+                # 停止时处理剩余的录音
+                if pending:
+                    self._process_continuous_batch(pending)
                     
+            threading.Thread(target=capture_loop, daemon=True).start()
             threading.Thread(target=continuous_loop, daemon=True).start()
         else:
+            self._continuous_stop.set()
             self.continuous_btn.config(text="开始连续测距")
             self.log("停止连续测距")
             
+    def _process_continuous_batch(self, recordings):
+        """
+        批量检测连续测距的录音并逐个更新距离
+        
+        Args:
+            recordings: 录音列表
+        """
+        results = self.signal_processor.detect_chirp_batch(recordings, threshold_ratio=0.2)
+        for detections, _ in results:
+            if len(detections) >= 2:
+                time_diff = (detections[1] - detections[0]) / self.signal_processor.sample_rate
+                distance = self.signal_processor.speed_of_sound * time_diff / 2
+                self._record_measurement(distance)
+                self.root.after(0, lambda d=distance: self._update_distance(d))
+                
+    def _time_axis(self, n, scale=1):
+        """
+        获取绘图用的时间轴（按长度和单位缓存）
+        
+        Args:
+            n: 采样点数
+            scale: 单位倍数（1为秒，1000为毫秒）
+            
+        Returns:
+            numpy.ndarray: 时间轴（只读）
+        """
+        key = (n, scale)
+        t = self._t_cache.get(key)
+        if t is None:
+            t = np.arange(n, dtype=np.float32) * np.float32(scale / self.signal_processor.sample_rate)
+            t.flags.writeable = False
+            self._t_cache[key] = t
+        return t
+        
+    def _spectrum(self, x):
+        """
+        计算绘图用的幅度谱
+        
+        频率轴按信号长度缓存；FFT使用 core.fft（安装了pyfftw时复用FFTW计划）
+        
+        Args:
+            x: 一维信号
+            
+        Returns:
+            tuple: (频率轴(kHz), 幅度谱)
+        """
+        n = len(x)
+        freqs_khz = self._freq_axes.get(n)
+        if freqs_khz is None:
+            freqs_khz = np.fft.rfftfreq(n, 1/self.signal_processor.sample_rate) / 1000
+            self._freq_axes[n] = freqs_khz
+        return freqs_khz, np.abs(rfft(np.asarray(x, dtype=np.float32)))
+        
+    def _get_view(self, name, specs):
+        """
+        获取（必要时创建）一组持久的坐标轴和曲线，并只显示这一组
+        
+        Args:
+            name: 视图名
+            specs: 每个子图的 (x轴标签, y轴标签, 标题)，从上到下排列
+            
+        Returns:
+            list: [(ax, line), ...]
+        """
+        view = self._views.get(name)
+        if view is None:
+            # 所有视图共用一个6行网格（2个子图各占3行，3个子图各占2行），
+            # 使 tight_layout 对各视图都适用
+            if self._grid is None:
+                self._grid = self.fig.add_gridspec(6, 1)
+            rows = 6 // len(specs)
+            view = []
+            for i, (xlabel, ylabel, title) in enumerate(specs):
+                ax = self.fig.add_subplot(self._grid[i * rows:(i + 1) * rows, 0])
+                line, = ax.plot([], [], animated=True)
+                ax.set_xlabel(xlabel)
+                ax.set_ylabel(ylabel)
+                ax.set_title(title)
+                view.append((ax, line))
+            self._views[name] = view
+            
+        if self._current_view != name:
+            for other, axes in self._views.items():
+                for ax, _ in axes:
+                    ax.set_visible(other == name)
+            self._current_view = name
+            self._layout_pending = True
+            self._full_redraw = True
+        return view
+        
+    def _set_line(self, ax, line, x, y, markers=()):
+        """
+        更新曲线数据和检测位置标记
+        
+        Args:
+            ax: 坐标轴
+            line: 曲线
+            x: 横坐标
+            y: 纵坐标
+            markers: 需要画竖线标记的横坐标
+        """
+        first = len(line.get_xdata()) == 0
+        line.set_data(x, y)
+        
+        # 新数据仍在当前纵轴范围内且占满一半以上时保持纵轴不变，便于局部刷新
+        limits = (ax.get_xlim(), ax.get_ylim())
+        low, high = limits[1]
+        keep_y = (not first and len(y) > 0 and
+                  low <= np.min(y) and np.max(y) <= high and
+                  np.max(y) - np.min(y) >= 0.5 * (high - low))
+        ax.relim()
+        ax.autoscale_view(scaley=not keep_y)
+        if (ax.get_xlim(), ax.get_ylim()) != limits:
+            self._full_redraw = True
+        
+        for marker in self._markers.pop(ax, ()):
+            marker.remove()
+        if len(markers):
+            self._markers[ax] = [ax.axvline(m, color='r', linestyle='--', alpha=0.7,
+                                            animated=True)
+                                 for m in markers]
+            
+    def _request_draw(self):
+        """请求重绘，100ms内的多次请求合并为一次"""
+        if self._layout_pending:
+            self.fig.tight_layout()
+            self._layout_pending = False
+            
+        if self._draw_scheduled:
+            return
+        wait_ms = int((self._last_draw + self.DRAW_INTERVAL - time.monotonic()) * 1000)
+        if wait_ms <= 0:
+            self._draw_now()
+        else:
+            self._draw_scheduled = True
+            self.root.after(wait_ms, self._draw_now)
+            
+    def _draw_now(self):
+        """执行重绘：坐标范围或布局变化时整图重绘，否则只局部刷新曲线"""
+        self._draw_scheduled = False
+        self._last_draw = time.monotonic()
+        
+        if self._full_redraw or not self._backgrounds:
+            # 整图重绘完成后由 _on_draw_event 缓存背景并画上曲线
+            self._full_redraw = False
+            self.canvas.draw_idle()
+            return
+            
+        for ax, line in self._views[self._current_view]:
+            self.canvas.restore_region(self._backgrounds[ax])
+            self._draw_animated(ax, line)
+            self.canvas.blit(ax.bbox)
+            
+    def _on_draw_event(self, event):
+        """整图重绘后缓存各坐标轴背景，并画上曲线和标记"""
+        view = self._views.get(self._current_view, ())
+        self._backgrounds = {ax: self.canvas.copy_from_bbox(ax.bbox) for ax, _ in view}
+        for ax, line in view:
+            self._draw_animated(ax, line)
+            
+    def _draw_animated(self, ax, line):
+        """在坐标轴上画出曲线和检测位置标记"""
+        ax.draw_artist(line)
+        for marker in self._markers.get(ax, ()):
+            ax.draw_artist(marker)
+        
     def show_chirp(self):
         """显示Chirp信号"""
         chirp = self.signal_processor.reference_chirp
         
-        self.fig.clear()
-        
-        # 时域
-        ax1 = self.fig.add_subplot(211)
-        t = np.arange(len(chirp)) / self.signal_processor.sample_rate * 1000
-        ax1.plot(t, chirp)
-        ax1.set_xlabel('时间 (ms)')
-        ax1.set_ylabel('幅度')
-        ax1.set_title('Chirp信号 - 时域')
-        ax1.grid(True, alpha=0.3)
-        
-        # 频谱
-        ax2 = self.fig.add_subplot(212)
-        freqs = np.fft.rfftfreq(len(chirp), 1/self.signal_processor.sample_rate)
-        spectrum = np.abs(np.fft.rfft(chirp))
-        ax2.plot(freqs/1000, spectrum)
-        ax2.set_xlabel('频率 (kHz)')
-        ax2.set_ylabel('幅度')
-        ax2.set_title('Chirp信号 - 频谱')
-        ax2.set_xlim(0, 25)
-        ax2.grid(True, alpha=0.3)
-        
-        self.fig.tight_layout()
-        self.canvas.draw()
+        # Chirp信号固定，曲线只在第一次创建视图时设置
+        first = 'chirp' not in self._views
+        (ax1, line1), (ax2, line2) = self._get_view('chirp', [
+            ('时间 (ms)', '幅度', 'Chirp信号 - 时域'),
+            ('频率 (kHz)', '幅度', 'Chirp信号 - 频谱'),
+        ])
+        if first:
+            # 时域
+            t = self._time_axis(len(chirp), 1000)
+            self._set_line(ax1, line1, t, chirp)
+            ax1.grid(True, alpha=0.3)
+            
+            # 频谱
+            if self._chirp_spectrum is None:
+                self._chirp_spectrum = self._spectrum(chirp)
+            ax2.set_xlim(0, 25)
+            self._set_line(ax2, line2, *self._chirp_spectrum)
+            ax2.grid(True, alpha=0.3)
+            
+        self._request_draw()
         
         self.log(f"Chirp信号: {self.signal_processor.chirp_f0/1000:.1f}kHz - {self.signal_processor.chirp_f1/1000:.1f}kHz, "
                 f"时长: {self.signal_processor.chirp_duration*1000:.1f}ms")
@@ -336,6 +618,7 @@ class StandaloneTestApp:
         self.log("录音2秒并分析...")
         
         def do_record():
+            boost_thread()
             recorded = self.audio.record_for_duration(2.0)
             detections, correlation = self.signal_processor.detect_chirp(recorded)
             
@@ -347,41 +630,26 @@ class StandaloneTestApp:
         """显示分析结果"""
         self.log(f"分析完成，检测到 {len(detections)} 个Chirp")
         
-        self.fig.clear()
+        (ax1, line1), (ax2, line2), (ax3, line3) = self._get_view('analysis', [
+            ('时间 (s)', '幅度', '录制的信号'),
+            ('频率 (kHz)', '幅度', '频谱'),
+            ('时间 (s)', '相关值', '互相关结果'),
+        ])
         
         # 原始信号
-        ax1 = self.fig.add_subplot(311)
-        t = np.arange(len(recorded)) / self.signal_processor.sample_rate
-        ax1.plot(t, recorded)
-        ax1.set_xlabel('时间 (s)')
-        ax1.set_ylabel('幅度')
-        ax1.set_title('录制的信号')
+        t = self._time_axis(len(recorded))
+        self._set_line(ax1, line1, *_envelope(t, recorded))
         
         # 频谱图
-        ax2 = self.fig.add_subplot(312)
-        freqs = np.fft.rfftfreq(len(recorded), 1/self.signal_processor.sample_rate)
-        spectrum = np.abs(np.fft.rfft(recorded))
-        ax2.plot(freqs/1000, spectrum)
-        ax2.set_xlabel('频率 (kHz)')
-        ax2.set_ylabel('幅度')
-        ax2.set_title('频谱')
         ax2.set_xlim(0, 25)
+        self._set_line(ax2, line2, *self._spectrum(recorded))
         
-        # 互相关
-        ax3 = self.fig.add_subplot(313)
-        t_corr = np.arange(len(correlation)) / self.signal_processor.sample_rate
-        ax3.plot(t_corr, correlation)
-        ax3.set_xlabel('时间 (s)')
-        ax3.set_ylabel('相关值')
-        ax3.set_title('互相关结果')
+        # 互相关，标记检测位置
+        t_corr = self._time_axis(len(correlation))
+        marks = np.asarray(detections) / self.signal_processor.sample_rate
+        self._set_line(ax3, line3, *_envelope(t_corr, correlation), markers=marks)
         
-        # 标记检测位置
-        for pos in detections:
-            t_pos = pos / self.signal_processor.sample_rate
-            ax3.axvline(t_pos, color='r', linestyle='--', alpha=0.7)
-            
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self._request_draw()
         
     def refresh_devices(self):
         """刷新设备列表"""
@@ -396,6 +664,13 @@ class StandaloneTestApp:
             self.output_list.insert(tk.END, f"[{d['id']}] {d['name']}")
             
         self.log(f"检测到 {len(devices['input'])} 个输入设备, {len(devices['output'])} 个输出设备")
+        
+    def on_closing(self):
+        """关闭窗口"""
+        if self.is_continuous:
+            self._continuous_stop.set()
+        self.audio.stop_stream()
+        self.root.destroy()
 
 
 def main():
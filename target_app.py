@@ -20,11 +20,92 @@ from datetime import datetime
 from core.ranging_engine import RangingEngine
 from core.signal_processor import SignalProcessor
 from core.audio_io import AudioIO
+from core.priority import boost_thread
+from core.log import setup_logging, clock_str
+
+
+class MeasurementLog:
+    """
+    测量记录（环形缓冲区）
+    
+    时间、实际距离、测量距离、误差分别存放在预分配的数组中，
+    写满后覆盖最旧的记录
+    """
+    
+    def __init__(self, capacity):
+        """
+        初始化测量记录
+        
+        Args:
+            capacity: 最多保留的记录数
+        """
+        self.capacity = capacity
+        self.time = [''] * capacity
+        self.actual = np.empty(capacity, dtype=np.float64)
+        self.measured = np.empty(capacity, dtype=np.float64)
+        self.error = np.empty(capacity, dtype=np.float64)
+        self._idx = 0    # 下一个写入位置
+        self._count = 0  # 有效记录数
+        
+    def __len__(self):
+        return self._count
+        
+    def append(self, time_str, actual, measured, error):
+        """
+        追加一条记录
+        
+        Args:
+            time_str: 时间字符串
+            actual: 实际距离
+            measured: 测量距离
+            error: 误差
+        """
+        i = self._idx
+        self.time[i] = time_str
+        self.actual[i] = actual
+        self.measured[i] = measured
+        self.error[i] = error
+        self._idx = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+            
+    def clear(self):
+        """清空记录"""
+        self._idx = 0
+        self._count = 0
+        
+    def table(self):
+        """
+        按时间顺序（旧到新）返回所有记录
+        
+        Returns:
+            numpy.recarray: 字段为 time, actual, measured, error 的记录数组
+        """
+        if self._count < self.capacity:
+            order = np.arange(self._count)
+        else:
+            order = np.roll(np.arange(self.capacity), -self._idx)
+        times = np.array([self.time[i] for i in order.tolist()], dtype=str)
+        return np.rec.fromarrays(
+            [times, self.actual[order], self.measured[order], self.error[order]],
+            names='time,actual,measured,error'
+        )
 
 
 class TargetDeviceApp:
     """目标设备应用程序"""
     
+    MAX_RECORDS = 5000        # 内存中保留的测量记录数
+    MAX_TREE_ROWS = 500       # 记录列表最多显示的行数
+    
+    STATE_TEXTS = {
+        'idle': '空闲',
+        'waiting': '等待中',
+        'sending': '发送信号',
+        'receiving': '接收信号',
+        'processing': '处理中'
+    }
+    
     def __init__(self, root):
         """
         初始化应用程序
@@ -46,14 +127,25 @@ class TargetDeviceApp:
         self.engine.on_connection_changed = self.on_connection_changed
         self.engine.on_error = self.on_error
         
-        # 测量历史
-        self.measurements = []
+        # 测量历史（有界，长时间运行不会无限增长）
+        self.measurements = MeasurementLog(self.MAX_RECORDS)
         self.is_recording = False
         self.actual_distance = 0  # 用于记录实际距离
         
+        # 待刷新到界面的状态增量，由回调线程合并写入、UI线程在空闲时一次应用
+        self._ui_state = {}
+        self._ui_pending = False
+        self._ui_lock = threading.Lock()
+        
         # 创建UI
         self._create_ui()
         
+        # 预先打开常开的音频流，第一次测量不再等待PortAudio打开设备
+        try:
+            self.engine.audio.open_stream()
+        except Exception as e:
+            self.log(f"音频流启动失败: {e}")
+            
         # 绑定关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
@@ -180,8 +272,7 @@ class TargetDeviceApp:
     def log(self, message):
         """添加日志"""
         self.log_text.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.log_text.insert(tk.END, f"[{clock_str(with_ms=False)}] {message}\n")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
         
@@ -216,23 +307,24 @@ class TargetDeviceApp:
         
     def on_connection_changed(self, connected, address):
         """连接状态改变回调"""
-        def update():
-            if connected:
-                self.connection_status.config(text="● 已连接", foreground="green")
-                self.connect_btn.config(state=tk.DISABLED)
-                self.disconnect_btn.config(state=tk.NORMAL)
-                self.start_btn.config(state=tk.NORMAL)
-                self.single_btn.config(state=tk.NORMAL)
-            else:
-                self.connection_status.config(text="● 未连接", foreground="red")
-                self.connect_btn.config(state=tk.NORMAL)
-                self.disconnect_btn.config(state=tk.DISABLED)
-                self.start_btn.config(state=tk.DISABLED)
-                self.stop_btn.config(state=tk.DISABLED)
-                self.single_btn.config(state=tk.DISABLED)
-                
-        self.root.after(0, update)
-        
+        self._post_ui(connected=connected)
+        
+    def _apply_connection(self, connected):
+        """按连接状态更新按钮和状态标签"""
+        if connected:
+            self.connection_status.config(text="● 已连接", foreground="green")
+            self.connect_btn.config(state=tk.DISABLED)
+            self.disconnect_btn.config(state=tk.NORMAL)
+            self.start_btn.config(state=tk.NORMAL)
+            self.single_btn.config(state=tk.NORMAL)
+        else:
+            self.connection_status.config(text="● 未连接", foreground="red")
+            self.connect_btn.config(state=tk.NORMAL)
+            self.disconnect_btn.config(state=tk.DISABLED)
+            self.start_btn.config(state=tk.DISABLED)
+            self.stop_btn.config(state=tk.DISABLED)
+            self.single_btn.config(state=tk.DISABLED)
+            
     def start_ranging(self):
         """开始测距"""
         if self.engine.start_ranging():
@@ -256,6 +348,7 @@ class TargetDeviceApp:
         self.log("执行单次测量...")
         
         def measure():
+            boost_thread()
             distance = self.engine.do_single_measurement()
             if distance is not None:
                 self.root.after(0, lambda: self.log(f"单次测量结果: {distance:.3f} m"))
@@ -265,61 +358,86 @@ class TargetDeviceApp:
         threading.Thread(target=measure, daemon=True).start()
         
     def on_distance_updated(self, distance):
-        """距离更新回调"""
-        def update():
-            # 更新显示
-            self.distance_label.config(text=f"{distance:.3f} m")
-            
-            # 更新统计
-            stats = self.engine.get_statistics()
-            if stats:
-                self.fps_label.config(text=f"FPS: {stats['fps']:.1f}")
-                self.mean_label.config(text=f"均值: {stats['mean']:.3f} m")
-                self.std_label.config(text=f"标准差: {stats['std']:.3f} m")
-                self.count_label.config(text=f"测量次数: {stats['count']}")
-                
-            # 如果正在记录，添加到记录列表
-            if self.is_recording:
-                try:
-                    actual = float(self.actual_dist_entry.get())
-                    error = abs(distance - actual)
-                    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                    
-                    self.measurements.append({
-                        'time': timestamp,
-                        'actual': actual,
-                        'measured': distance,
-                        'error': error
-                    })
-                    
-                    self.record_tree.insert('', 0, values=(
-                        timestamp, f"{actual:.2f}", f"{distance:.3f}", f"{error:.3f}"
-                    ))
-                except ValueError:
-                    pass
-                    
-        self.root.after(0, update)
+        """距离更新回调（在测距线程中调用）"""
+        timestamp = clock_str()
+        self._post_ui(distance=(timestamp, distance), stats=self.engine.get_statistics())
         
     def on_state_changed(self, state):
         """状态改变回调"""
-        state_texts = {
-            'idle': '空闲',
-            'waiting': '等待中',
-            'sending': '发送信号',
-            'receiving': '接收信号',
-            'processing': '处理中'
-        }
-        
-        def update():
-            text = state_texts.get(state, state)
-            self.state_label.config(text=f"状态: {text}")
-            
-        self.root.after(0, update)
+        self._post_ui(state=state)
         
     def on_error(self, error_msg):
         """错误回调"""
-        self.root.after(0, lambda: self.log(f"错误: {error_msg}"))
+        self._post_ui(error=error_msg)
         
+    def _post_ui(self, **delta):
+        """
+        合并一次界面更新，只在没有待执行的刷新时调度一次 after_idle
+        
+        Args:
+            **delta: 状态增量；distance 和 error 逐条累积，其余只保留最新值
+        """
+        with self._ui_lock:
+            for key, value in delta.items():
+                if key in ('distance', 'error'):
+                    self._ui_state.setdefault(key, []).append(value)
+                else:
+                    self._ui_state[key] = value
+            if self._ui_pending:
+                return
+            self._ui_pending = True
+        self.root.after_idle(self._flush_ui)
+        
+    def _flush_ui(self):
+        """一次性应用所有待刷新的界面更新"""
+        # 在锁内取走数据并清除标志，之后到达的更新会触发新的刷新
+        with self._ui_lock:
+            state, self._ui_state = self._ui_state, {}
+            self._ui_pending = False
+            
+        if 'connected' in state:
+            self._apply_connection(state['connected'])
+            
+        if 'state' in state:
+            text = self.STATE_TEXTS.get(state['state'], state['state'])
+            self.state_label.config(text=f"状态: {text}")
+            
+        for error_msg in state.get('error', ()):
+            self.log(f"错误: {error_msg}")
+            
+        distances = state.get('distance')
+        if not distances:
+            return
+            
+        # 标签只显示最新结果
+        self.distance_label.config(text=f"{distances[-1][1]:.3f} m")
+        stats = state.get('stats')
+        if stats:
+            self.fps_label.config(text=f"FPS: {stats['fps']:.1f}")
+            self.mean_label.config(text=f"均值: {stats['mean']:.3f} m")
+            self.std_label.config(text=f"标准差: {stats['std']:.3f} m")
+            self.count_label.config(text=f"测量次数: {stats['count']}")
+            
+        # 如果正在记录，批量添加到记录列表
+        if self.is_recording:
+            try:
+                actual = float(self.actual_dist_entry.get())
+            except ValueError:
+                return
+            # 追加到末尾（插到开头会移动所有已有行），再滚动到最新一行
+            for timestamp, distance in distances:
+                error = abs(distance - actual)
+                self.measurements.append(timestamp, actual, distance, error)
+                iid = self.record_tree.insert('', tk.END, values=(
+                    timestamp, f"{actual:.2f}", f"{distance:.3f}", f"{error:.3f}"
+                ))
+                
+            # 只显示最新的若干行，完整数据保留在 self.measurements 中
+            children = self.record_tree.get_children()
+            if len(children) > self.MAX_TREE_ROWS:
+                self.record_tree.delete(*children[:-self.MAX_TREE_ROWS])
+            self.record_tree.see(iid)
+                
     def toggle_recording(self):
         """切换记录状态"""
         self.is_recording = not self.is_recording
@@ -332,7 +450,7 @@ class TargetDeviceApp:
             
     def clear_records(self):
         """清除记录"""
-        self.measurements = []
+        self.measurements.clear()
         for item in self.record_tree.get_children():
             self.record_tree.delete(item)
         self.log("已清除记录")
@@ -346,11 +464,11 @@ class TargetDeviceApp:
         filename = f"ranging_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("时间,实际距离(m),测量距离(m),误差(m)\n")
-                for m in self.measurements:
-                    f.write(f"{m['time']},{m['actual']},{m['measured']},{m['error']}\n")
-                    
+            # 整张表一次写出；'%s' 输出浮点数的最短表示，与逐行格式化的结果相同
+            np.savetxt(filename, self.measurements.table(), fmt='%s', delimiter=',',
+                       header='时间,实际距离(m),测量距离(m),误差(m)', comments='',
+                       encoding='utf-8')
+            
             self.log(f"数据已导出到 {filename}")
             messagebox.showinfo("成功", f"数据已导出到 {filename}")
         except Exception as e:
@@ -365,6 +483,7 @@ class TargetDeviceApp:
 
 def main():
     """主函数"""
+    setup_logging()
     root = tk.Tk()
     app = TargetDeviceApp(root)
     root.mainloop()